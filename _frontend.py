@@ -0,0 +1,600 @@
+# ZoteBoat: Empires Beyond -- ZoteScript front-end (lexer, AST, parser).
+# Python stdlib only. Optionally compiled with Cython (see setup.py); a
+# built extension shadows this file on import.
+
+from __future__ import annotations
+from sys import intern
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# -------------------------
+# Errors
+# -------------------------
+
+class ZoteError(Exception):
+    def __init__(self, msg: str, file: str = "<unknown>", line: int = 1, col: int = 1):
+        super().__init__(f"{file}:{line}:{col}: {msg}")
+        self.file = file
+        self.line = line
+        self.col = col
+        self.msg = msg
+
+# -------------------------
+# Lexer
+# -------------------------
+
+class Tok:
+    __slots__ = ("t", "v", "line", "col")
+    def __init__(self, t: str, v: Any, line: int, col: int):
+        self.t = t; self.v = v; self.line = line; self.col = col
+    def __repr__(self) -> str:
+        return f"Tok({self.t!r}, {self.v!r}, {self.line}, {self.col})"
+
+KEYWORDS = {
+    "let","fn","if","else","while","for","in","range",
+    "return","break","continue","import",
+    "true","false","null","and","or"
+}
+
+SINGLE = {
+    "(": "LP", ")": "RP",
+    "{": "LB", "}": "RB",
+    "[": "LS", "]": "RS",
+    ",": "COM", ";": "SEM", ":": "COL"
+}
+
+DOUBLE = {
+    "==":"EQ", "!=":"NE", "<=":"LE", ">=":"GE"
+}
+
+# string escapes: char after the backslash -> replacement
+_ESC = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+
+# first-character classes for the lexer's dispatch table (ASCII only;
+# anything else is classified with str.isalpha/isdigit)
+K_ERR, K_ID_START, K_WS, K_DIGIT, K_OP, K_SINGLE, K_STR, K_HASH = range(8)
+
+def _build_kind_table() -> Tuple[int, ...]:
+    kind = [K_ERR] * 128
+    for c in " \t\r\n": kind[ord(c)] = K_WS
+    for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_": kind[ord(c)] = K_ID_START
+    for c in "0123456789": kind[ord(c)] = K_DIGIT
+    for c in "+-*/%<>!=": kind[ord(c)] = K_OP
+    for c in SINGLE: kind[ord(c)] = K_SINGLE
+    kind[ord('"')] = K_STR
+    kind[ord("#")] = K_HASH
+    return tuple(kind)
+
+KIND = _build_kind_table()
+
+# token type for each single-char punctuation, indexed by ord()
+SINGLE_TAB: List[Optional[str]] = [None] * 128
+for _c, _t in SINGLE.items():
+    SINGLE_TAB[ord(_c)] = _t
+del _c, _t
+
+class Lexer:
+    def __init__(self, src: str, file: str):
+        self.s = src
+        self.file = file
+        self.i = 0
+        self.line = 1
+        self.col = 1
+
+    def _err(self, msg: str, pos: int) -> ZoteError:
+        # errors are rare: recover line/col for `pos` from the source itself
+        line = self.s.count("\n", 0, pos) + 1
+        col = pos - self.s.rfind("\n", 0, pos)
+        return ZoteError(msg, self.file, line, col)
+
+    def tokens(self) -> List[Tok]:
+        return list(self.stream())
+
+    def stream(self) -> Iterator[Tok]:
+        s = self.s
+        n = len(s)
+        i, line, col = self.i, self.line, self.col
+        while i < n:
+            ch = s[i]
+            o = ord(ch)
+            if o < 128:
+                k = KIND[o]
+            elif ch.isdigit():
+                k = K_DIGIT
+            elif ch.isalpha():
+                k = K_ID_START
+            else:
+                k = K_ERR
+
+            # identifier / keyword
+            if k == K_ID_START:
+                j = i + 1
+                while j < n and (s[j].isalnum() or s[j] == "_"):
+                    j += 1
+                # interned, so env/local dict probes on this name hit by identity
+                name = intern(s[i:j])
+                if name in KEYWORDS:
+                    yield Tok(name.upper(), name, line, col)
+                else:
+                    yield Tok("ID", name, line, col)
+                col += j - i
+                i = j
+                continue
+
+            if k == K_WS:
+                j = i + 1
+                while j < n and s[j] in " \t\r\n":
+                    j += 1
+                nl = s.count("\n", i, j)
+                if nl:
+                    line += nl
+                    col = j - s.rfind("\n", i, j)
+                else:
+                    col += j - i
+                i = j
+                continue
+
+            # number
+            if k == K_DIGIT:
+                j = i + 1
+                while j < n and s[j].isdigit():
+                    j += 1
+                is_float = False
+                if j + 1 < n and s[j] == "." and s[j+1].isdigit():
+                    is_float = True
+                    j += 2
+                    while j < n and s[j].isdigit():
+                        j += 1
+                txt = s[i:j]
+                yield Tok("NUM", float(txt) if is_float else int(txt), line, col)
+                col += j - i
+                i = j
+                continue
+
+            # single-char punctuation
+            if k == K_SINGLE:
+                yield Tok(SINGLE_TAB[o], ch, line, col)
+                i += 1; col += 1
+                continue
+
+            # operators; every two-char op starts with an op char
+            if k == K_OP:
+                two = s[i:i+2]
+                if two in DOUBLE:
+                    yield Tok(DOUBLE[two], intern(two), line, col)
+                    i += 2; col += 2
+                else:
+                    yield Tok("OP", ch, line, col)
+                    i += 1; col += 1
+                continue
+
+            # string
+            if k == K_STR:
+                j = s.find('"', i + 1)
+                if j >= 0 and s.find("\\", i + 1, j) < 0:
+                    # no escapes: the body is a plain slice
+                    text = s[i+1:j]
+                    j += 1
+                else:
+                    # copy the runs between escapes as slices
+                    buf = []
+                    j = i + 1
+                    while True:
+                        q = s.find('"', j)
+                        b = s.find("\\", j, q if q >= 0 else n)
+                        if b < 0:
+                            if q < 0:
+                                raise self._err("Unterminated string", n)
+                            buf.append(s[j:q])
+                            j = q + 1
+                            break
+                        if b > j:
+                            buf.append(s[j:b])
+                        esc = s[b+1] if b + 1 < n else ""
+                        repl = _ESC.get(esc)
+                        if repl is None:
+                            raise self._err(f"Unknown escape \\{esc}", b + 1)
+                        buf.append(repl)
+                        j = b + 2
+                    text = "".join(buf)
+                if text.isidentifier():
+                    # map keys like "resources"/"kind" are looked up constantly
+                    text = intern(text)
+                yield Tok("STR", text, line, col)
+                nl = s.count("\n", i, j)
+                if nl:
+                    line += nl
+                    col = j - s.rfind("\n", i, j)
+                else:
+                    col += j - i
+                i = j
+                continue
+
+            if k == K_HASH:
+                j = s.find("\n", i)
+                if j < 0:
+                    j = n
+                col += j - i
+                i = j
+                continue
+
+            raise self._err(f"Unexpected character: {ch!r}", i)
+
+        self.i, self.line, self.col = i, line, col
+        yield Tok("EOF", None, line, col)
+
+# -------------------------
+# AST Nodes
+# -------------------------
+# Plain classes with __slots__: no per-node __dict__, and field reads are
+# slot loads on the interpreter's hot paths.
+
+class Node:
+    # exec_fn / eval_fn are filled in by the runtime's annotate pass
+    __slots__ = ("tok", "exec_fn", "eval_fn")
+    def __init__(self, tok: Tok):
+        self.tok = tok
+
+class Program(Node):
+    __slots__ = ("body", "ops")  # ops: (exec_fn, stmt) pairs, set by annotate
+    def __init__(self, tok: Tok, body: List[Node]):
+        self.tok = tok; self.body = body; self.ops = ()
+
+class Block(Node):
+    __slots__ = ("body", "ops")  # ops: (exec_fn, stmt) pairs, set by annotate
+    def __init__(self, tok: Tok, body: List[Node]):
+        self.tok = tok; self.body = body; self.ops = ()
+
+class Import(Node):
+    __slots__ = ("path",)
+    def __init__(self, tok: Tok, path: str):
+        self.tok = tok; self.path = path
+
+class Let(Node):
+    __slots__ = ("name", "expr", "slot")
+    def __init__(self, tok: Tok, name: str, expr: Node):
+        self.tok = tok; self.name = name; self.expr = expr; self.slot = -1
+
+class Assign(Node):
+    __slots__ = ("target", "expr")  # target is Var or Index
+    def __init__(self, tok: Tok, target: Node, expr: Node):
+        self.tok = tok; self.target = target; self.expr = expr
+
+class Var(Node):
+    __slots__ = ("name", "slot")  # slot: frame index inside a function, else -1
+    def __init__(self, tok: Tok, name: str):
+        self.tok = tok; self.name = name; self.slot = -1
+
+class Index(Node):
+    __slots__ = ("obj", "key")
+    def __init__(self, tok: Tok, obj: Node, key: Node):
+        self.tok = tok; self.obj = obj; self.key = key
+
+class Literal(Node):
+    __slots__ = ("value",)
+    def __init__(self, tok: Tok, value: Any):
+        self.tok = tok; self.value = value
+
+class ListLit(Node):
+    __slots__ = ("items",)
+    def __init__(self, tok: Tok, items: List[Node]):
+        self.tok = tok; self.items = items
+
+class MapLit(Node):
+    __slots__ = ("items",)  # string keys only
+    def __init__(self, tok: Tok, items: List[Tuple[str, Node]]):
+        self.tok = tok; self.items = items
+
+class If(Node):
+    __slots__ = ("cond", "then_b", "else_b")
+    def __init__(self, tok: Tok, cond: Node, then_b: Block, else_b: Optional[Block]):
+        self.tok = tok; self.cond = cond; self.then_b = then_b; self.else_b = else_b
+
+class While(Node):
+    __slots__ = ("cond", "body")
+    def __init__(self, tok: Tok, cond: Node, body: Block):
+        self.tok = tok; self.cond = cond; self.body = body
+
+class ForRange(Node):
+    __slots__ = ("name", "start", "end", "body", "slot")
+    def __init__(self, tok: Tok, name: str, start: Node, end: Node, body: Block):
+        self.tok = tok; self.name = name; self.start = start; self.end = end; self.body = body
+        self.slot = -1
+
+class Fn(Node):
+    __slots__ = ("name", "params", "body", "slot", "nslots", "param_slots")
+    def __init__(self, tok: Tok, name: str, params: List[str], body: Block):
+        self.tok = tok; self.name = name; self.params = params; self.body = body
+        self.slot = -1; self.nslots = 0; self.param_slots: Optional[Tuple[int, ...]] = None
+
+class Call(Node):
+    __slots__ = ("fn", "args")  # args becomes a tuple once resolved
+    def __init__(self, tok: Tok, fn: Node, args: List[Node]):
+        self.tok = tok; self.fn = fn; self.args = args
+
+class Return(Node):
+    __slots__ = ("expr",)
+    def __init__(self, tok: Tok, expr: Optional[Node]):
+        self.tok = tok; self.expr = expr
+
+class Break(Node):
+    __slots__ = ()
+
+class Continue(Node):
+    __slots__ = ()
+
+class ExprStmt(Node):
+    __slots__ = ("expr",)
+    def __init__(self, tok: Tok, expr: Node):
+        self.tok = tok; self.expr = expr
+
+class Unary(Node):
+    __slots__ = ("op", "expr")
+    def __init__(self, tok: Tok, op: str, expr: Node):
+        self.tok = tok; self.op = op; self.expr = expr
+
+class Binary(Node):
+    __slots__ = ("op", "a", "b")
+    def __init__(self, tok: Tok, op: str, a: Node, b: Node):
+        self.tok = tok; self.op = op; self.a = a; self.b = b
+
+# fields holding child nodes (or lists of them); MapLit is handled apart
+CHILD_FIELDS = {
+    Program: ("body",), Block: ("body",), Let: ("expr",), Assign: ("target", "expr"),
+    Index: ("obj", "key"), ListLit: ("items",), If: ("cond", "then_b", "else_b"),
+    While: ("cond", "body"), ForRange: ("start", "end", "body"), Fn: ("body",),
+    Call: ("fn", "args"), Return: ("expr",), ExprStmt: ("expr",), Unary: ("expr",),
+    Binary: ("a", "b"),
+}
+
+def iter_children(node: Node) -> Iterator[Node]:
+    if type(node) is MapLit:
+        for _, v in node.items:
+            yield v
+        return
+    for f in CHILD_FIELDS.get(type(node), ()):
+        v = getattr(node, f)
+        if v is None:
+            continue
+        if type(v) is list or type(v) is tuple:
+            yield from v
+        else:
+            yield v
+
+# -------------------------
+# Parser
+# -------------------------
+
+# binary operator precedence; all levels are left-associative
+PREC = {
+    "or": 1, "and": 2,
+    "==": 3, "!=": 3,
+    "<": 4, ">": 4, "<=": 4, ">=": 4,
+    "+": 5, "-": 5,
+    "*": 6, "/": 6, "%": 6,
+}
+
+# token types that may carry a binary operator
+BINOP_TOKS = {"OP", "OR", "AND", "EQ", "NE", "LE", "GE"}
+
+class Parser:
+    # Tokens are pulled from the lexer on demand. The grammar needs no
+    # lookahead past the current token (self.tok). EOF is sticky once reached.
+    def __init__(self, toks: Iterable[Tok], file: str):
+        self._it = iter(toks)
+        self.file = file
+        self.tok: Tok = next(self._it)
+
+    def _advance(self) -> Tok:
+        tok = self.tok
+        self.tok = next(self._it, tok)
+        return tok
+
+    def _eat(self, t: str) -> Tok:
+        tok = self.tok
+        if tok.t != t:
+            raise ZoteError(f"Expected {t}, got {tok.t}", self.file, tok.line, tok.col)
+        self._advance()
+        return tok
+
+    def _match(self, *types: str) -> Optional[Tok]:
+        tok = self.tok
+        if tok.t in types:
+            self._advance()
+            return tok
+        return None
+
+    def parse(self) -> Program:
+        body: List[Node] = []
+        start = self.tok
+        while self.tok.t != "EOF":
+            body.append(self.stmt())
+        return Program(start, body)
+
+    def stmt(self) -> Node:
+        tok = self.tok
+        if self._match("SEM"):
+            return ExprStmt(tok, Literal(tok, None))
+
+        if self._match("IMPORT"):
+            p = self._eat("STR")
+            self._eat("SEM")
+            return Import(tok, p.v)
+
+        if self._match("LET"):
+            name = self._eat("ID")
+            self._eat("OP")  # '=' as OP
+            expr = self.expr()
+            self._eat("SEM")
+            return Let(tok, name.v, expr)
+
+        if self._match("FN"):
+            name = self._eat("ID")
+            self._eat("LP")
+            params: List[str] = []
+            if self.tok.t != "RP":
+                params.append(self._eat("ID").v)
+                while self._match("COM"):
+                    params.append(self._eat("ID").v)
+            self._eat("RP")
+            body = self.block()
+            return Fn(tok, name.v, params, body)
+
+        if self._match("RETURN"):
+            if self.tok.t == "SEM":
+                self._eat("SEM")
+                return Return(tok, None)
+            expr = self.expr()
+            self._eat("SEM")
+            return Return(tok, expr)
+
+        if self._match("BREAK"):
+            self._eat("SEM")
+            return Break(tok)
+
+        if self._match("CONTINUE"):
+            self._eat("SEM")
+            return Continue(tok)
+
+        if self._match("IF"):
+            cond = self.expr()
+            then_b = self.block()
+            else_b = None
+            if self._match("ELSE"):
+                else_b = self.block()
+            return If(tok, cond, then_b, else_b)
+
+        if self._match("WHILE"):
+            cond = self.expr()
+            body = self.block()
+            return While(tok, cond, body)
+
+        if self._match("FOR"):
+            name = self._eat("ID").v
+            self._eat("IN")
+            self._eat("RANGE")
+            self._eat("LP")
+            start = self.expr()
+            self._eat("COM")
+            end = self.expr()
+            self._eat("RP")
+            body = self.block()
+            return ForRange(tok, name, start, end, body)
+
+        # assignment or expression statement
+        expr = self.expr()
+        op = self._match("OP")
+        if op is not None and op.v == "=":
+            rhs = self.expr()
+            self._eat("SEM")
+            return Assign(tok, expr, rhs)
+        self._eat("SEM")
+        return ExprStmt(tok, expr)
+
+    def block(self) -> Block:
+        tok = self._eat("LB")
+        body: List[Node] = []
+        while self.tok.t != "RB":
+            body.append(self.stmt())
+        self._eat("RB")
+        return Block(tok, body)
+
+    # Expression parsing (precedence climbing over PREC)
+    def expr(self) -> Node:
+        return self._binexpr(1)
+
+    def _binexpr(self, min_prec: int) -> Node:
+        node = self.unary()
+        while True:
+            tok = self.tok
+            if tok.t not in BINOP_TOKS:
+                break
+            prec = PREC.get(tok.v)
+            if prec is None or prec < min_prec:
+                break
+            self._advance()
+            node = Binary(tok, tok.v, node, self._binexpr(prec + 1))
+        return node
+
+    def unary(self) -> Node:
+        tok = self.tok
+        if tok.t == "OP" and tok.v in "-!":
+            self._advance()
+            return Unary(tok, tok.v, self.unary())
+        return self.call()
+
+
+    def call(self) -> Node:
+        node = self.primary()
+        while True:
+            t = self.tok.t
+            if t == "LP":
+                self._advance()
+                args: List[Node] = []
+                if self.tok.t != "RP":
+                    args.append(self.expr())
+                    while self.tok.t == "COM":
+                        self._advance()
+                        args.append(self.expr())
+                self._eat("RP")
+                node = Call(node.tok, node, args)
+            elif t == "LS":
+                self._advance()
+                key = self.expr()
+                self._eat("RS")
+                node = Index(node.tok, node, key)
+            else:
+                break
+        return node
+
+    def primary(self) -> Node:
+        tok = self.tok
+        t = tok.t
+        if t == "ID":
+            self._advance()
+            return Var(tok, tok.v)
+        if t == "NUM" or t == "STR":
+            self._advance()
+            return Literal(tok, tok.v)
+        if t == "TRUE":
+            self._advance()
+            return Literal(tok, True)
+        if t == "FALSE":
+            self._advance()
+            return Literal(tok, False)
+        if t == "NULL":
+            self._advance()
+            return Literal(tok, None)
+        if t == "LP":
+            self._advance()
+            node = self.expr()
+            self._eat("RP")
+            return node
+        if t == "LS":
+            self._advance()
+            items: List[Node] = []
+            if self.tok.t != "RS":
+                items.append(self.expr())
+                while self.tok.t == "COM":
+                    self._advance()
+                    items.append(self.expr())
+            self._eat("RS")
+            return ListLit(tok, items)
+        if t == "LB":
+            self._advance()
+            # map literal: {"k": expr, ...}
+            pairs: List[Tuple[str, Node]] = []
+            if self.tok.t != "RB":
+                k = self._eat("STR").v
+                self._eat("COL")
+                v = self.expr()
+                pairs.append((k, v))
+                while self.tok.t == "COM":
+                    self._advance()
+                    k = self._eat("STR").v
+                    self._eat("COL")
+                    v = self.expr()
+                    pairs.append((k, v))
+            self._eat("RB")
+            return MapLit(tok, pairs)
+
+        raise ZoteError(f"Unexpected token {t}", self.file, tok.line, tok.col)
@@ -1,502 +1,31 @@
 #!/usr/bin/env python3
 # ZoteBoat: Empires Beyond
-# Python stdlib only.
+# Python stdlib only (orjson is used when installed).
 
 from __future__ import annotations
-import json, os, sys, math, random, traceback
-from dataclasses import dataclass
+import hashlib, json, os, sys, math, operator, random, traceback
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Tuple, Callable
 
-# -------------------------
-# Errors
-# -------------------------
-
-class ZoteError(Exception):
-    def __init__(self, msg: str, file: str = "<unknown>", line: int = 1, col: int = 1):
-        super().__init__(f"{file}:{line}:{col}: {msg}")
-        self.file = file
-        self.line = line
-        self.col = col
-        self.msg = msg
-
-# -------------------------
-# Lexer
-# -------------------------
-
-@dataclass
-class Tok:
-    t: str
-    v: Any
-    line: int
-    col: int
-
-KEYWORDS = {
-    "let","fn","if","else","while","for","in","range",
-    "return","break","continue","import",
-    "true","false","null","and","or"
-}
-
-SINGLE = {
-    "(": "LP", ")": "RP",
-    "{": "LB", "}": "RB",
-    "[": "LS", "]": "RS",
-    ",": "COM", ";": "SEM", ":": "COL"
-}
-
-DOUBLE = {
-    "==":"EQ", "!=":"NE", "<=":"LE", ">=":"GE"
-}
-
-class Lexer:
-    def __init__(self, src: str, file: str):
-        self.s = src
-        self.file = file
-        self.i = 0
-        self.line = 1
-        self.col = 1
-
-    def _peek(self, n=0) -> str:
-        j = self.i + n
-        return self.s[j] if j < len(self.s) else ""
-
-    def _adv(self) -> str:
-        ch = self._peek()
-        self.i += 1
-        if ch == "\n":
-            self.line += 1
-            self.col = 1
-        else:
-            self.col += 1
-        return ch
-
-    def _err(self, msg: str) -> ZoteError:
-        return ZoteError(msg, self.file, self.line, self.col)
-
-    def tokens(self) -> List[Tok]:
-        out: List[Tok] = []
-        while self.i < len(self.s):
-            ch = self._peek()
-            if ch in " \t\r\n":
-                self._adv()
-                continue
-            if ch == "#":
-                while self._peek() and self._peek() != "\n":
-                    self._adv()
-                continue
+try:
+    import orjson  # optional, faster JSON for save files
+except ImportError:
+    orjson = None
 
-            line, col = self.line, self.col
-
-            # two-char ops
-            two = ch + self._peek(1)
-            if two in DOUBLE:
-                self._adv(); self._adv()
-                out.append(Tok(DOUBLE[two], two, line, col))
-                continue
-
-            # single-char punctuation
-            if ch in SINGLE:
-                self._adv()
-                out.append(Tok(SINGLE[ch], ch, line, col))
-                continue
-
-            # one-char ops
-            if ch in "+-*/%<>!=":
-                self._adv()
-                out.append(Tok("OP", ch, line, col))
-                continue
-
-            # string
-            if ch == '"':
-                self._adv()
-                buf = []
-                while True:
-                    c = self._peek()
-                    if c == "":
-                        raise self._err("Unterminated string")
-                    if c == '"':
-                        self._adv()
-                        break
-                    if c == "\\":
-                        self._adv()
-                        esc = self._peek()
-                        if esc == "n":
-                            self._adv(); buf.append("\n")
-                        elif esc == "t":
-                            self._adv(); buf.append("\t")
-                        elif esc == '"':
-                            self._adv(); buf.append('"')
-                        elif esc == "\\":
-                            self._adv(); buf.append("\\")
-                        else:
-                            raise self._err(f"Unknown escape \\{esc}")
-                        continue
-                    buf.append(self._adv())
-                out.append(Tok("STR", "".join(buf), line, col))
-                continue
-
-            # number
-            if ch.isdigit():
-                buf = [self._adv()]
-                is_float = False
-                while self._peek().isdigit():
-                    buf.append(self._adv())
-                if self._peek() == "." and self._peek(1).isdigit():
-                    is_float = True
-                    buf.append(self._adv())
-                    while self._peek().isdigit():
-                        buf.append(self._adv())
-                txt = "".join(buf)
-                out.append(Tok("NUM", float(txt) if is_float else int(txt), line, col))
-                continue
-
-            # identifier / keyword
-            if ch.isalpha() or ch == "_":
-                buf = [self._adv()]
-                while (self._peek().isalnum() or self._peek() == "_"):
-                    buf.append(self._adv())
-                name = "".join(buf)
-                if name in KEYWORDS:
-                    out.append(Tok(name.upper(), name, line, col))
-                else:
-                    out.append(Tok("ID", name, line, col))
-                continue
-
-            raise self._err(f"Unexpected character: {ch!r}")
-
-        out.append(Tok("EOF", None, self.line, self.col))
-        return out
-
-# -------------------------
-# AST Nodes
-# -------------------------
-
-@dataclass
-class Node: tok: Tok
-
-@dataclass
-class Program(Node): body: List[Node]
-
-@dataclass
-class Block(Node): body: List[Node]
-
-@dataclass
-class Import(Node): path: str
-
-@dataclass
-class Let(Node): name: str; expr: Node
-
-@dataclass
-class Assign(Node): target: Node; expr: Node  # target is Var or Index
-
-@dataclass
-class Var(Node): name: str
-
-@dataclass
-class Index(Node): obj: Node; key: Node
-
-@dataclass
-class Literal(Node): value: Any
-
-@dataclass
-class ListLit(Node): items: List[Node]
-
-@dataclass
-class MapLit(Node): items: List[Tuple[str, Node]]  # string keys only
-
-@dataclass
-class If(Node): cond: Node; then_b: Block; else_b: Optional[Block]
-
-@dataclass
-class While(Node): cond: Node; body: Block
-
-@dataclass
-class ForRange(Node): name: str; start: Node; end: Node; body: Block
-
-@dataclass
-class Fn(Node): name: str; params: List[str]; body: Block
-
-@dataclass
-class Call(Node): fn: Node; args: List[Node]
-
-@dataclass
-class Return(Node): expr: Optional[Node]
-
-@dataclass
-class Break(Node): pass
-
-@dataclass
-class Continue(Node): pass
-
-@dataclass
-class ExprStmt(Node): expr: Node
-
-@dataclass
-class Unary(Node): op: str; expr: Node
-
-@dataclass
-class Binary(Node): op: str; a: Node; b: Node
-
-# -------------------------
-# Parser
-# -------------------------
-
-class Parser:
-    def __init__(self, toks: List[Tok], file: str):
-        self.toks = toks
-        self.file = file
-        self.i = 0
-
-    def _peek(self, n=0) -> Tok:
-        j = self.i + n
-        return self.toks[j] if j < len(self.toks) else self.toks[-1]
-
-    def _eat(self, t: str) -> Tok:
-        tok = self._peek()
-        if tok.t != t:
-            raise ZoteError(f"Expected {t}, got {tok.t}", self.file, tok.line, tok.col)
-        self.i += 1
-        return tok
-
-    def _match(self, *types: str) -> Optional[Tok]:
-        tok = self._peek()
-        if tok.t in types:
-            self.i += 1
-            return tok
-        return None
-
-    def parse(self) -> Program:
-        body: List[Node] = []
-        start = self._peek()
-        while self._peek().t != "EOF":
-            body.append(self.stmt())
-        return Program(start, body)
-
-    def stmt(self) -> Node:
-        tok = self._peek()
-        if self._match("SEM"):
-            return ExprStmt(tok, Literal(tok, None))
-
-        if self._match("IMPORT"):
-            p = self._eat("STR")
-            self._eat("SEM")
-            return Import(tok, p.v)
-
-        if self._match("LET"):
-            name = self._eat("ID")
-            self._eat("OP")  # '=' as OP
-            expr = self.expr()
-            self._eat("SEM")
-            return Let(tok, name.v, expr)
-
-        if self._match("FN"):
-            name = self._eat("ID")
-            self._eat("LP")
-            params: List[str] = []
-            if self._peek().t != "RP":
-                params.append(self._eat("ID").v)
-                while self._match("COM"):
-                    params.append(self._eat("ID").v)
-            self._eat("RP")
-            body = self.block()
-            return Fn(tok, name.v, params, body)
-
-        if self._match("RETURN"):
-            if self._peek().t == "SEM":
-                self._eat("SEM")
-                return Return(tok, None)
-            expr = self.expr()
-            self._eat("SEM")
-            return Return(tok, expr)
-
-        if self._match("BREAK"):
-            self._eat("SEM")
-            return Break(tok)
-
-        if self._match("CONTINUE"):
-            self._eat("SEM")
-            return Continue(tok)
-
-        if self._match("IF"):
-            cond = self.expr()
-            then_b = self.block()
-            else_b = None
-            if self._match("ELSE"):
-                else_b = self.block()
-            return If(tok, cond, then_b, else_b)
-
-        if self._match("WHILE"):
-            cond = self.expr()
-            body = self.block()
-            return While(tok, cond, body)
-
-        if self._match("FOR"):
-            name = self._eat("ID").v
-            self._eat("IN")
-            self._eat("RANGE")
-            self._eat("LP")
-            start = self.expr()
-            self._eat("COM")
-            end = self.expr()
-            self._eat("RP")
-            body = self.block()
-            return ForRange(tok, name, start, end, body)
-
-        # assignment or expression statement
-        expr = self.expr()
-        if self._match("OP") and self.toks[self.i-1].v == "=":
-            rhs = self.expr()
-            self._eat("SEM")
-            return Assign(tok, expr, rhs)
-        self._eat("SEM")
-        return ExprStmt(tok, expr)
-
-    def block(self) -> Block:
-        tok = self._eat("LB")
-        body: List[Node] = []
-        while self._peek().t != "RB":
-            body.append(self.stmt())
-        self._eat("RB")
-        return Block(tok, body)
-
-    # Expression parsing (precedence climbing)
-    def expr(self) -> Node:
-        return self.logic_or()
-
-    def logic_or(self) -> Node:
-        node = self.logic_and()
-        while self._match("OR"):
-            op = self.toks[self.i-1]
-            node = Binary(op, "or", node, self.logic_and())
-        return node
-
-    def logic_and(self) -> Node:
-        node = self.equality()
-        while self._match("AND"):
-            op = self.toks[self.i-1]
-            node = Binary(op, "and", node, self.equality())
-        return node
-
-    def equality(self) -> Node:
-        node = self.compare()
-        while True:
-            if self._match("EQ"):
-                op = self.toks[self.i-1]
-                node = Binary(op, "==", node, self.compare())
-            elif self._match("NE"):
-                op = self.toks[self.i-1]
-                node = Binary(op, "!=", node, self.compare())
-            else:
-                break
-        return node
-
-    def compare(self) -> Node:
-        node = self.term()
-        while True:
-            if self._match("LE"):
-                op = self.toks[self.i-1]; node = Binary(op, "<=", node, self.term())
-            elif self._match("GE"):
-                op = self.toks[self.i-1]; node = Binary(op, ">=", node, self.term())
-            elif self._peek().t == "OP" and self._peek().v in "<>":
-                op = self._eat("OP")
-                node = Binary(op, op.v, node, self.term())
-            else:
-                break
-        return node
-
-    def term(self) -> Node:
-        node = self.factor()
-        while self._peek().t == "OP" and self._peek().v in "+-":
-            op = self._eat("OP")
-            node = Binary(op, op.v, node, self.factor())
-        return node
-
-    def factor(self) -> Node:
-        node = self.unary()
-        while self._peek().t == "OP" and self._peek().v in "*/%":
-            op = self._eat("OP")
-            node = Binary(op, op.v, node, self.unary())
-        return node
-
-    def unary(self) -> Node:
-        if self._peek().t == "OP" and self._peek().v in "-!":
-            op = self._eat("OP")
-            return Unary(op, op.v, self.unary())
-        return self.call()
-
-
-    def call(self) -> Node:
-        node = self.primary()
-        while True:
-            if self._match("LP"):
-                args: List[Node] = []
-                if self._peek().t != "RP":
-                    args.append(self.expr())
-                    while self._match("COM"):
-                        args.append(self.expr())
-                self._eat("RP")
-                node = Call(node.tok, node, args)
-            elif self._match("LS"):
-                key = self.expr()
-                self._eat("RS")
-                node = Index(node.tok, node, key)
-            else:
-                break
-        return node
-
-    def primary(self) -> Node:
-        tok = self._peek()
-        if self._match("NUM"):
-            return Literal(tok, tok.v)
-        if self._match("STR"):
-            return Literal(tok, tok.v)
-        if self._match("TRUE"):
-            return Literal(tok, True)
-        if self._match("FALSE"):
-            return Literal(tok, False)
-        if self._match("NULL"):
-            return Literal(tok, None)
-        if self._match("ID"):
-            return Var(tok, tok.v)
-        if self._match("LP"):
-            node = self.expr()
-            self._eat("RP")
-            return node
-        if self._match("LS"):
-            items: List[Node] = []
-            if self._peek().t != "RS":
-                items.append(self.expr())
-                while self._match("COM"):
-                    items.append(self.expr())
-            self._eat("RS")
-            return ListLit(tok, items)
-        if self._match("LB"):
-            # map literal: {"k": expr, ...}
-            items: List[Tuple[str, Node]] = []
-            if self._peek().t != "RB":
-                k = self._eat("STR").v
-                self._eat("COL")
-                v = self.expr()
-                items.append((k, v))
-                while self._match("COM"):
-                    k = self._eat("STR").v
-                    self._eat("COL")
-                    v = self.expr()
-                    items.append((k, v))
-            self._eat("RB")
-            return MapLit(tok, items)
-
-        raise ZoteError(f"Unexpected token {tok.t}", self.file, tok.line, tok.col)
+from _frontend import (
+    ZoteError, Tok, Lexer, Parser,
+    Node, Program, Block, Import, Let, Assign, Var, Index, Literal, ListLit, MapLit,
+    If, While, ForRange, Fn, Call, Return, Break, Continue, ExprStmt, Unary, Binary,
+    CHILD_FIELDS, iter_children,
+)
 
 # -------------------------
 # Runtime Values
 # -------------------------
 
-class ReturnSig(Exception):
-    def __init__(self, value: Any):
-        self.value = value
-
-class BreakSig(Exception): pass
-class ContinueSig(Exception): pass
+# Statement handlers return one of these; anything but NORMAL unwinds to
+# the enclosing loop or call. A return's value is left on the Runtime.
+NORMAL, BREAK, CONTINUE, RETURN = 0, 1, 2, 3
 
 @dataclass
 class ZoteFn:
@@ -505,6 +34,9 @@ class ZoteFn:
     body: Block
     env: Dict[str, Any]   # module/global env
     file: str
+    nslots: int = 0                     # frame size, from resolve()
+    # frame index of each param; None when they are simply 0..n-1
+    param_slots: Optional[Tuple[int, ...]] = None
 
 @dataclass
 class NativeFn:
@@ -513,80 +45,66 @@ class NativeFn:
     fn: Callable[..., Any]
 
 def truthy(v: Any) -> bool:
-    if v is None: return False
-    if v is False: return False
-    if v == 0 or v == 0.0: return False
-    if v == "": return False
-    if isinstance(v, (list, dict)) and len(v) == 0: return False
+    # booleans first: they are what conditions evaluate to most of the time
+    if v is True: return True
+    if v is None or v is False: return False
+    t = type(v)
+    if t is int or t is float: return v != 0
+    if t is str or t is list or t is dict: return len(v) != 0
     return True
 
+_BINOPS: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul,
+    "/": operator.truediv, "%": operator.mod,
+}
+# bool stays accepted, as it was under isinstance(x, (int, float))
+_NUM_TYPES = frozenset((int, float, bool))
+_CMP_TYPES = frozenset((int, float, bool, str))
+
 def num_binop(op: str, a: Any, b: Any, tok: Tok, file: str) -> Any:
-    if not isinstance(a, (int,float)) or not isinstance(b, (int,float)):
+    ta = type(a); tb = type(b)
+    if ta not in _NUM_TYPES or tb not in _NUM_TYPES:
         raise ZoteError(f"Operator {op} requires numbers", file, tok.line, tok.col)
-    if op == "+": return a + b
-    if op == "-": return a - b
-    if op == "*": return a * b
+    fn = _BINOPS.get(op)
+    if fn is None:
+        raise ZoteError(f"Unknown op {op}", file, tok.line, tok.col)
     if op == "/":
         if b == 0: raise ZoteError("Division by zero", file, tok.line, tok.col)
-        return a / b
-    if op == "%":
-        if not isinstance(a,int) or not isinstance(b,int):
+    elif op == "%":
+        if ta is float or tb is float:
             raise ZoteError("% requires ints", file, tok.line, tok.col)
         if b == 0: raise ZoteError("Modulo by zero", file, tok.line, tok.col)
-        return a % b
-    raise ZoteError(f"Unknown op {op}", file, tok.line, tok.col)
+    return fn(a, b)
+
+_ACTION_DESCRIBERS: Dict[str, Callable[[dict], str]] = {
+    "policy": lambda a: "Enact policy '%s' on faction '%s'" % (a.get("policy"), a.get("faction")),
+    "repeal_policy": lambda a: "Repeal policy '%s' on faction '%s'" % (a.get("policy"), a.get("faction")),
+    "research": lambda a: "Research tech '%s' for faction '%s'" % (a.get("tech"), a.get("faction")),
+    "treaty": lambda a: "Propose treaty '%s' between '%s' and '%s'" % (a.get("treaty"), a.get("a"), a.get("b")),
+    "break_treaty": lambda a: "Break treaty between '%s' and '%s'" % (a.get("a"), a.get("b")),
+    "trade": lambda a: "Trade deal: '%s' gives %s to '%s' for %s" % (
+        a.get("a"), a.get("give", {}), a.get("b"), a.get("take", {})),
+    "war": lambda a: "Declare war: '%s' vs '%s'" % (a.get("a"), a.get("b")),
+    "peace": lambda a: "Offer peace between '%s' and '%s'" % (a.get("a"), a.get("b")),
+    "espionage": lambda a: "Espionage: '%s' targets '%s' mission='%s'" % (
+        a.get("actor"), a.get("target"), a.get("mission")),
+    "space_build": lambda a: "Build habitat '%s' controlled by '%s'" % (a.get("habitat"), a.get("faction")),
+    "space_ship": lambda a: "Ship cargo %s from '%s' to habitat '%s'" % (
+        a.get("cargo", {}), a.get("from"), a.get("to")),
+    "space_research": lambda a: "Space research '%s' for faction '%s'" % (a.get("tech"), a.get("faction")),
+}
 
 def describe_action(a: dict) -> str:
     kind = a.get("kind", "unknown")
-
-    if kind == "policy":
-        return f"Enact policy '{a.get('policy')}' on faction '{a.get('faction')}'"
-
-    if kind == "repeal_policy":
-        return f"Repeal policy '{a.get('policy')}' on faction '{a.get('faction')}'"
-
-    if kind == "research":
-        return f"Research tech '{a.get('tech')}' for faction '{a.get('faction')}'"
-
-    if kind == "treaty":
-        return f"Propose treaty '{a.get('treaty')}' between '{a.get('a')}' and '{a.get('b')}'"
-
-    if kind == "break_treaty":
-        return f"Break treaty between '{a.get('a')}' and '{a.get('b')}'"
-
-    if kind == "trade":
-        give = a.get("give", {})
-        take = a.get("take", {})
-        return (f"Trade deal: '{a.get('a')}' gives {give} "
-                f"to '{a.get('b')}' for {take}")
-
-    if kind == "war":
-        return f"Declare war: '{a.get('a')}' vs '{a.get('b')}'"
-
-    if kind == "peace":
-        return f"Offer peace between '{a.get('a')}' and '{a.get('b')}'"
-
-    if kind == "espionage":
-        return (f"Espionage: '{a.get('actor')}' targets '{a.get('target')}' "
-                f"mission='{a.get('mission')}'")
-
-    if kind == "space_build":
-        return f"Build habitat '{a.get('habitat')}' controlled by '{a.get('faction')}'"
-
-    if kind == "space_ship":
-        cargo = a.get("cargo", {})
-        return (f"Ship cargo {cargo} from '{a.get('from')}' "
-                f"to habitat '{a.get('to')}'")
-
-    if kind == "space_research":
-        return f"Space research '{a.get('tech')}' for faction '{a.get('faction')}'"
-
+    fn = _ACTION_DESCRIBERS.get(kind)
+    if fn is not None:
+        return fn(a)
     return f"{kind}: {a}"
 
 
 def fmt_num(x):
-    if isinstance(x, float):
-        return f"{x:.1f}"
+    if type(x) is float:
+        return "%.1f" % x
     return str(x)
 
 def safe_get(d, *keys, default=None):
@@ -597,9 +115,37 @@ def safe_get(d, *keys, default=None):
         cur = cur[k]
     return cur
 
-def top_dashboard(state: dict, debug: bool = False) -> str:
+# Derived faction lookups for the display helpers. Kept out of the state
+# map, which is serialized and hashed. The REPL builds one per state
+# version (ReplContext.faction_index); without one, helpers sort or scan
+# on the spot.
+class FactionIndex:
+    __slots__ = ("order", "lower")
+    def __init__(self, state: dict):
+        fs = state.get("factions", {})
+        self.order: List[str] = sorted(fs.keys())
+        self.lower: Dict[str, str] = {}  # lowercase name -> canonical name
+        for k in fs:
+            self.lower.setdefault(k.lower(), k)
+
+def get_faction_order(state: dict, index: Optional[FactionIndex] = None) -> List[str]:
+    if index is None:
+        return sorted(state.get("factions", {}).keys())
+    return index.order
+
+def _faction_ci(state: dict, name: str, index: Optional[FactionIndex]) -> Optional[str]:
+    # case-insensitive match; the first matching key wins
+    low = name.lower()
+    if index is not None:
+        return index.lower.get(low)
+    for k in state.get("factions", {}):
+        if k.lower() == low:
+            return k
+    return None
+
+def top_dashboard(state: dict, debug: bool = False, index: Optional[FactionIndex] = None) -> str:
     fs = state.get("factions", {})
-    names = sorted(fs.keys())
+    names = get_faction_order(state, index)
 
     mkt = state.get("market", {})
     infl = mkt.get("inflation", 0.0)
@@ -633,7 +179,8 @@ def top_dashboard(state: dict, debug: bool = False) -> str:
         energy = res.get("energy", 0)
         units = res.get("units", 0)
 
-        row = f"{n} | {pop} | {fmt_num(morale)} | {fmt_num(unrest)} | {fmt_num(credits)} | {fmt_num(food)} | {fmt_num(water)} | {fmt_num(energy)} | {fmt_num(units)}"
+        row = " | ".join((str(n), str(pop), fmt_num(morale), fmt_num(unrest), fmt_num(credits),
+                          fmt_num(food), fmt_num(water), fmt_num(energy), fmt_num(units)))
 
         if debug:
             rho = f.get("rho", 0.0)
@@ -683,11 +230,13 @@ def cmd_help() -> str:
         "  quit                  exit\n"
     )
 
+# fmt_resources shows these first, in this order, then any others sorted
+_CORE_RESOURCES = ("food","water","energy","metal","silicon","credits","influence","morale","units","parts")
+_CORE_RESOURCE_SET = frozenset(_CORE_RESOURCES)
+
 def fmt_resources(res: dict) -> str:
-    # show core first, then others
-    core = ["food","water","energy","metal","silicon","credits","influence","morale","units","parts"]
     parts = []
-    for k in core:
+    for k in _CORE_RESOURCES:
         if k in res:
             v = res[k]
             if isinstance(v, float):
@@ -695,31 +244,30 @@ def fmt_resources(res: dict) -> str:
             else:
                 parts.append(f"{k}={v}")
     # any extra keys
-    extras = [k for k in res.keys() if k not in core]
+    extras = [k for k in res if k not in _CORE_RESOURCE_SET]
     extras.sort()
     for k in extras:
         parts.append(f"{k}={res[k]}")
     return ", ".join(parts)
 
-def show_factions(state: dict) -> str:
+def show_factions(state: dict, index: Optional[FactionIndex] = None) -> str:
     fs = state.get("factions", {})
-    names = sorted(fs.keys())
+    names = get_faction_order(state, index)
     lines = ["Factions:"]
     for n in names:
         f = fs[n]
         lines.append(f"  - {n} (pop={f.get('pop')}, morale={f.get('resources',{}).get('morale')}, unrest={f.get('unrest')})")
     return "\n".join(lines)
 
-def show_one_faction(state: dict, name: str, debug: bool = False) -> str:
+def show_one_faction(state: dict, name: str, debug: bool = False, index: Optional[FactionIndex] = None) -> str:
     fs = state.get("factions", {})
     f = fs.get(name)
     if not f:
         # try case-insensitive match
-        for k in fs.keys():
-            if k.lower() == name.lower():
-                f = fs[k]
-                name = k
-                break
+        k = _faction_ci(state, name, index)
+        if k is not None:
+            f = fs[k]
+            name = k
     if not f:
         return f"Unknown faction '{name}'. Try: factions"
 
@@ -748,9 +296,9 @@ def show_one_faction(state: dict, name: str, debug: bool = False) -> str:
 
     return "\n".join(lines)
 
-def show_research(state: dict) -> str:
+def show_research(state: dict, index: Optional[FactionIndex] = None) -> str:
     fs = state.get("factions", {})
-    names = sorted(fs.keys())
+    names = get_faction_order(state, index)
     lines = ["Research status:"]
     for n in names:
         tech = fs[n].get("tech", {})
@@ -759,9 +307,9 @@ def show_research(state: dict) -> str:
         lines.append(f"  - {n}: {', '.join(done) if done else '(none)'}")
     return "\n".join(lines)
 
-def show_policies(state: dict) -> str:
+def show_policies(state: dict, index: Optional[FactionIndex] = None) -> str:
     fs = state.get("factions", {})
-    names = sorted(fs.keys())
+    names = get_faction_order(state, index)
     lines = ["Policies active:"]
     for n in names:
         pol = fs[n].get("policies", {})
@@ -816,15 +364,11 @@ def action_involved_factions(a: dict) -> list[str]:
 
     return []
 
-def normalize_faction_name(state: dict, name: str) -> str | None:
+def normalize_faction_name(state: dict, name: str, index: Optional[FactionIndex] = None) -> str | None:
     fs = state.get("factions", {})
     if name in fs:
         return name
-    low = name.lower()
-    for k in fs.keys():
-        if k.lower() == low:
-            return k
-    return None
+    return _faction_ci(state, name, index)
 
 def group_actions_by_faction(state: dict, actions: list[dict]) -> dict[str, list[dict]]:
     groups: dict[str, list[dict]] = {}
@@ -857,24 +401,82 @@ def show_market(state: dict) -> str:
 # Interpreter
 # -------------------------
 
+def _push(lst: Any, v: Any) -> None:
+    lst.append(v)
+
+# Natives that don't depend on a Runtime, built once at import. The
+# RNG and hook natives are bound per Runtime in Runtime.__init__.
+_STATIC_STDLIB: Dict[str, NativeFn] = {
+    # IO
+    "print": NativeFn("print", None, lambda *args: print(*args)),
+    "input": NativeFn("input", 1, lambda prompt: input(str(prompt))),
+
+    # basic utils
+    "len":   NativeFn("len", 1, lambda x: len(x)),
+    "keys":  NativeFn("keys", 1, lambda m: list(m.keys())),
+    "has":   NativeFn("has", 2, lambda m,k: (k in m)),
+    "push":  NativeFn("push", 2, _push),
+    "pop":   NativeFn("pop", 1, lambda lst: (lst.pop() if lst else None)),
+    "str":   NativeFn("str", 1, lambda x: str(x)),
+    "num":   NativeFn("num", 1, lambda x: float(x) if (("." in str(x)) or ("e" in str(x).lower())) else int(x)),
+    "floor": NativeFn("floor", 1, lambda x: int(math.floor(float(x)))),
+    "abs":   NativeFn("abs", 1, lambda x: abs(x)),
+    "min":   NativeFn("min", 2, lambda a,b: a if a < b else b),
+    "max":   NativeFn("max", 2, lambda a,b: a if a > b else b),
+    "clamp": NativeFn("clamp", 3, lambda x,lo,hi: lo if x<lo else (hi if x>hi else x)),
+}
+
+_normpath = os.path.normpath
+_joinpath = os.path.join
+_stat = os.stat
+
 class Runtime:
+    # Parsed and annotated module ASTs, shared by every Runtime in the
+    # process: path -> (mtime_ns, ast). An edited file is parsed again and
+    # replaces its entry, so there is one tree per file at most.
+    _ast_cache: Dict[str, Tuple[int, Program]] = {}
+
     def __init__(self, root_dir: str, debug: bool = False):
         self.root_dir = root_dir
         self.debug_enabled = debug
         self.module_cache: Dict[str, Dict[str, Any]] = {}
         self.rng = random.Random(0)
         self.event_sink: List[Dict[str, Any]] = []
+        self._return_value: Any = None
+        self._signal_node: Optional[Node] = None  # last break/continue/return run
+        # every module env starts from a copy of this
+        self._stdlib: Dict[str, NativeFn] = dict(_STATIC_STDLIB)
+        self._stdlib.update({
+            # RNG
+            "rng_seed":   NativeFn("rng_seed", 1, self._rng_seed),
+            "rng_int":    NativeFn("rng_int", 2, self._rng_int),
+            "rng_float":  NativeFn("rng_float", 0, self._rng_float),
+            "rng_choice": NativeFn("rng_choice", 1, self._rng_choice),
+
+            # hooks
+            "emit_event": NativeFn("emit_event", 2, self._emit_event),
+            "debug":      NativeFn("debug", 1, self._debug),
+        })
 
     def load_module(self, path: str) -> Dict[str, Any]:
-        norm = os.path.normpath(os.path.join(self.root_dir, path))
+        norm = _normpath(_joinpath(self.root_dir, path))
         if norm in self.module_cache:
             return self.module_cache[norm]
-        if not os.path.exists(norm):
+        try:
+            mtime = _stat(norm).st_mtime_ns
+        except OSError:
             raise ZoteError(f"Module not found: {path}", path, 1, 1)
-        with open(norm, "r", encoding="utf-8") as f:
-            src = f.read()
-        toks = Lexer(src, path).tokens()
-        ast = Parser(toks, path).parse()
+        cached = Runtime._ast_cache.get(norm)
+        if cached is not None and cached[0] == mtime:
+            ast = cached[1]
+        else:
+            with open(norm, "r", encoding="utf-8") as f:
+                src = f.read()
+            ast = Parser(Lexer(src, path).stream(), path).parse()
+            fold(ast)
+            resolve(ast)
+            annotate(ast)
+            Runtime._ast_cache[norm] = (mtime, ast)
         env: Dict[str, Any] = {}
         self._install_stdlib(env)
         self.module_cache[norm] = env
@@ -882,33 +484,7 @@ class Runtime:
         return env
 
     def _install_stdlib(self, env: Dict[str, Any]) -> None:
-        # IO
-        env["print"] = NativeFn("print", None, lambda *args: print(*args))
-        env["input"] = NativeFn("input", 1, lambda prompt: input(str(prompt)))
-
-        # basic utils
-        env["len"] = NativeFn("len", 1, lambda x: len(x))
-        env["keys"] = NativeFn("keys", 1, lambda m: list(m.keys()))
-        env["has"] = NativeFn("has", 2, lambda m,k: (k in m))
-        env["push"] = NativeFn("push", 2, lambda lst,v: (lst.append(v), None)[1])
-        env["pop"]  = NativeFn("pop", 1, lambda lst: (lst.pop() if lst else None))
-        env["str"]  = NativeFn("str", 1, lambda x: str(x))
-        env["num"]  = NativeFn("num", 1, lambda x: float(x) if (("." in str(x)) or ("e" in str(x).lower())) else int(x))
-        env["floor"]= NativeFn("floor", 1, lambda x: int(math.floor(float(x))))
-        env["abs"]  = NativeFn("abs", 1, lambda x: abs(x))
-        env["min"]  = NativeFn("min", 2, lambda a,b: a if a < b else b)
-        env["max"]  = NativeFn("max", 2, lambda a,b: a if a > b else b)
-        env["clamp"]= NativeFn("clamp", 3, lambda x,lo,hi: lo if x<lo else (hi if x>hi else x))
-
-        # RNG
-        env["rng_seed"] = NativeFn("rng_seed", 1, self._rng_seed)
-        env["rng_int"]  = NativeFn("rng_int", 2, self._rng_int)
-        env["rng_float"]= NativeFn("rng_float", 0, self._rng_float)
-        env["rng_choice"]= NativeFn("rng_choice", 1, self._rng_choice)
-
-        # hooks
-        env["emit_event"] = NativeFn("emit_event", 2, self._emit_event)
-        env["debug"] = NativeFn("debug", 1, self._debug)
+        env.update(self._stdlib)
 
     def _rng_seed(self, n: Any) -> None:
         self.rng.seed(int(n)); return None
@@ -934,76 +510,20 @@ class Runtime:
         return None
 
     def exec_program(self, prog: Program, env: Dict[str, Any], file: str) -> None:
-        for st in prog.body:
-            self.exec_stmt(st, env, env, file)
-
-    def exec_block(self, block: Block, local: Dict[str, Any], env: Dict[str, Any], file: str) -> None:
-        for st in block.body:
-            self.exec_stmt(st, local, env, file)
-
-    def exec_stmt(self, node: Node, local: Dict[str, Any], env: Dict[str, Any], file: str) -> None:
-        if isinstance(node, Import):
-            imported = self.load_module(node.path)
-            # merge: imported names become available in this module
-            # do not overwrite existing names (local module wins)
-            for k, v in imported.items():
-                if k not in env:
-                    env[k] = v
-            return
-        if isinstance(node, Let):
-            local[node.name] = self.eval_expr(node.expr, local, env, file)
-            return
-        if isinstance(node, Fn):
-            local[node.name] = ZoteFn(node.name, node.params, node.body, env, file)
-            return
-        if isinstance(node, Assign):
-            val = self.eval_expr(node.expr, local, env, file)
-            self._assign(node.target, val, local, env, file)
-            return
-        if isinstance(node, If):
-            if truthy(self.eval_expr(node.cond, local, env, file)):
-                self.exec_block(node.then_b, local, env, file)
-            elif node.else_b:
-                self.exec_block(node.else_b, local, env, file)
-            return
-        if isinstance(node, While):
-            while truthy(self.eval_expr(node.cond, local, env, file)):
-                try:
-                    self.exec_block(node.body, local, env, file)
-                except ContinueSig:
-                    continue
-                except BreakSig:
-                    break
-            return
-        if isinstance(node, ForRange):
-            a = self.eval_expr(node.start, local, env, file)
-            b = self.eval_expr(node.end, local, env, file)
-            if not isinstance(a, (int,float)) or not isinstance(b, (int,float)):
-                raise ZoteError("range(a,b) requires numbers", file, node.tok.line, node.tok.col)
-            ia, ib = int(a), int(b)
-            for i in range(ia, ib):
-                local[node.name] = i
-                try:
-                    self.exec_block(node.body, local, env, file)
-                except ContinueSig:
-                    continue
-                except BreakSig:
-                    break
-            return
-        if isinstance(node, Return):
-            val = None if node.expr is None else self.eval_expr(node.expr, local, env, file)
-            raise ReturnSig(val)
-        if isinstance(node, Break):
-            raise BreakSig()
-        if isinstance(node, Continue):
-            raise ContinueSig()
-        if isinstance(node, ExprStmt):
-            self.eval_expr(node.expr, local, env, file)
-            return
-        raise ZoteError(f"Unknown statement node {type(node)}", file, node.tok.line, node.tok.col)
+        rc = _run_block(prog, self, env, env, file)
+        if rc:
+            tok = self._signal_node.tok
+            raise ZoteError(f"'{_SIGNAL_NAMES[rc]}' outside {'function' if rc == RETURN else 'loop'}", file, tok.line, tok.col)
+
+    def exec_block(self, block: Block, local: Dict[str, Any], env: Dict[str, Any], file: str) -> int:
+        return _run_block(block, self, local, env, file)
+
+    def exec_stmt(self, node: Node, local: Dict[str, Any], env: Dict[str, Any], file: str) -> int:
+        return node.exec_fn(node, self, local, env, file)
 
     def _assign(self, target: Node, val: Any, local: Dict[str, Any], env: Dict[str, Any], file: str) -> None:
-        if isinstance(target, Var):
+        tt = type(target)
+        if tt is Var:
             if target.name in local:
                 local[target.name] = val
             elif target.name in env:
@@ -1012,92 +532,30 @@ class Runtime:
                 # implicit global if not local?
                 local[target.name] = val
             return
-        if isinstance(target, Index):
+        if tt is Index:
             obj = self.eval_expr(target.obj, local, env, file)
             key = self.eval_expr(target.key, local, env, file)
-            if isinstance(obj, list):
-                if not isinstance(key, (int,float)):
+            t = type(obj)
+            if t is list:
+                if type(key) not in _NUM_TYPES:
                     raise ZoteError("List index must be number", file, target.tok.line, target.tok.col)
                 idx = int(key)
                 if idx < 0 or idx >= len(obj):
                     raise ZoteError("List index out of range", file, target.tok.line, target.tok.col)
                 obj[idx] = val
                 return
-            if isinstance(obj, dict):
+            if t is dict:
                 obj[key] = val
                 return
             raise ZoteError("Index assignment target must be list or map", file, target.tok.line, target.tok.col)
         raise ZoteError("Invalid assignment target", file, target.tok.line, target.tok.col)
 
     def eval_expr(self, node: Node, local: Dict[str, Any], env: Dict[str, Any], file: str) -> Any:
-        if isinstance(node, Literal):
-            return node.value
-        if isinstance(node, Var):
-            if node.name in local: return local[node.name]
-            if node.name in env: return env[node.name]
-            raise ZoteError(f"Undefined variable '{node.name}'", file, node.tok.line, node.tok.col)
-        if isinstance(node, ListLit):
-            return [self.eval_expr(x, local, env, file) for x in node.items]
-        if isinstance(node, MapLit):
-            m: Dict[Any, Any] = {}
-            for k, vexpr in node.items:
-                m[k] = self.eval_expr(vexpr, local, env, file)
-            return m
-        if isinstance(node, Index):
-            obj = self.eval_expr(node.obj, local, env, file)
-            key = self.eval_expr(node.key, local, env, file)
-            if isinstance(obj, list):
-                idx = int(key)
-                if idx < 0 or idx >= len(obj):
-                    return None
-                return obj[idx]
-            if isinstance(obj, dict):
-                return obj.get(key, None)
-            raise ZoteError("Indexing requires list or map", file, node.tok.line, node.tok.col)
-        if isinstance(node, Unary):
-            v = self.eval_expr(node.expr, local, env, file)
-            if node.op == "-":
-                if not isinstance(v, (int,float)):
-                    raise ZoteError("Unary - requires number", file, node.tok.line, node.tok.col)
-                return -v
-            if node.op == "!":
-                return not truthy(v)
-            raise ZoteError(f"Unknown unary {node.op}", file, node.tok.line, node.tok.col)
-        if isinstance(node, Binary):
-            if node.op == "and":
-                a = self.eval_expr(node.a, local, env, file)
-                return self.eval_expr(node.b, local, env, file) if truthy(a) else a
-            if node.op == "or":
-                a = self.eval_expr(node.a, local, env, file)
-                return a if truthy(a) else self.eval_expr(node.b, local, env, file)
-
-            a = self.eval_expr(node.a, local, env, file)
-            b = self.eval_expr(node.b, local, env, file)
-
-            if node.op in {"+","-","*","/","%"}:
-                # string concat for +
-                if node.op == "+" and (isinstance(a, str) or isinstance(b, str)):
-                    return str(a) + str(b)
-                return num_binop(node.op, a, b, node.tok, file)
-
-            if node.op in {"==","!="}:
-                return (a == b) if node.op == "==" else (a != b)
-            if node.op in {"<",">","<=",">="}:
-                if not isinstance(a, (int,float,str)) or not isinstance(b, (int,float,str)):
-                    raise ZoteError(f"Compare {node.op} requires comparable types", file, node.tok.line, node.tok.col)
-                if node.op == "<": return a < b
-                if node.op == ">": return a > b
-                if node.op == "<=": return a <= b
-                if node.op == ">=": return a >= b
-            raise ZoteError(f"Unknown binary {node.op}", file, node.tok.line, node.tok.col)
-        if isinstance(node, Call):
-            fnv = self.eval_expr(node.fn, local, env, file)
-            args = [self.eval_expr(a, local, env, file) for a in node.args]
-            return self._call(fnv, args, node.tok, file)
-        raise ZoteError(f"Unknown expr node {type(node)}", file, node.tok.line, node.tok.col)
+        return node.eval_fn(node, self, local, env, file)
 
     def _call(self, fnv: Any, args: List[Any], tok: Tok, file: str) -> Any:
-        if isinstance(fnv, NativeFn):
+        t = type(fnv)
+        if t is NativeFn:
             if fnv.arity is not None and len(args) != fnv.arity:
                 raise ZoteError(f"{fnv.name} expects {fnv.arity} args", file, tok.line, tok.col)
             try:
@@ -1106,19 +564,479 @@ class Runtime:
                 raise
             except Exception as e:
                 raise ZoteError(f"Native error in {fnv.name}: {e}", file, tok.line, tok.col)
-        if isinstance(fnv, ZoteFn):
+        if t is ZoteFn:
             if len(args) != len(fnv.params):
                 raise ZoteError(f"{fnv.name} expects {len(fnv.params)} args", file, tok.line, tok.col)
-            call_locals: Dict[str, Any] = {}
-            for p, a in zip(fnv.params, args):
-                call_locals[p] = a
-            try:
-                self.exec_block(fnv.body, call_locals, fnv.env, fnv.file)
-            except ReturnSig as r:
-                return r.value
+            ps = fnv.param_slots
+            if ps is None:
+                frame = args + [_UNSET] * (fnv.nslots - len(args))
+            else:
+                # repeated param names share a slot; the last one wins
+                frame = [_UNSET] * fnv.nslots
+                for s, a in zip(ps, args):
+                    frame[s] = a
+            rc = _run_block(fnv.body, self, frame, fnv.env, fnv.file)
+            if rc == RETURN:
+                v = self._return_value; self._return_value = None
+                return v
+            if rc:
+                st = self._signal_node.tok
+                raise ZoteError(f"'{_SIGNAL_NAMES[rc]}' outside loop", fnv.file, st.line, st.col)
             return None
         raise ZoteError("Attempted to call non-function", file, tok.line, tok.col)
 
+# -------------------------
+# Node handlers
+# -------------------------
+# annotate() walks a freshly parsed AST once and stores on every node the
+# handler for its type (exec_fn for statements, eval_fn for expressions).
+# Unary and Binary nodes get a handler for their specific operator, so the
+# hot paths never look up a type or compare op strings. All handlers are
+# called as fn(node, rt, local, env, file).
+#
+# At module level local is env. Inside a function local is a list frame:
+# resolve() numbers every name the function can bind (params, let, for,
+# nested fn, assignment targets) and stores the index in the nodes' slot.
+# A slot still holding _UNSET reads through to env, as a name not yet put
+# in the old per-call dict did; names the function never binds go straight
+# to env.
+
+Scope = Dict[str, Any]
+Frame = List[Any]
+
+_UNSET = object()
+
+_SIGNAL_NAMES = {BREAK: "break", CONTINUE: "continue", RETURN: "return"}
+
+def _run_block(block: Block, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    for h, st in block.ops:
+        rc = h(st, rt, local, env, file)
+        if rc: return rc
+    return NORMAL
+
+def _exec_import(node: Import, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    imported = rt.load_module(node.path)
+    # merge: imported names become available in this module
+    # do not overwrite existing names (local module wins)
+    for k, v in imported.items():
+        if k not in env:
+            env[k] = v
+    return NORMAL
+
+def _exec_let(node: Let, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    e = node.expr
+    local[node.name] = e.eval_fn(e, rt, local, env, file)
+    return NORMAL
+
+def _exec_fn(node: Fn, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    local[node.name] = ZoteFn(node.name, node.params, node.body, env, file, node.nslots, node.param_slots)
+    return NORMAL
+
+def _exec_assign(node: Assign, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    e = node.expr
+    rt._assign(node.target, e.eval_fn(e, rt, local, env, file), local, env, file)
+    return NORMAL
+
+def _exec_if(node: If, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    c = node.cond
+    if truthy(c.eval_fn(c, rt, local, env, file)):
+        return _run_block(node.then_b, rt, local, env, file)
+    if node.else_b:
+        return _run_block(node.else_b, rt, local, env, file)
+    return NORMAL
+
+def _exec_while(node: While, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    c = node.cond; ev = c.eval_fn; body = node.body.ops; tr = truthy
+    while tr(ev(c, rt, local, env, file)):
+        for h, st in body:
+            rc = h(st, rt, local, env, file)
+            if rc: break
+        else:
+            continue
+        if rc == BREAK: break
+        if rc == RETURN: return rc
+    return NORMAL
+
+def _exec_for(node: ForRange, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    s = node.start; e = node.end
+    a = s.eval_fn(s, rt, local, env, file)
+    b = e.eval_fn(e, rt, local, env, file)
+    if type(a) not in _NUM_TYPES or type(b) not in _NUM_TYPES:
+        raise ZoteError("range(a,b) requires numbers", file, node.tok.line, node.tok.col)
+    name = node.name
+    body = node.body.ops
+    for i in range(int(a), int(b)):
+        local[name] = i
+        for h, st in body:
+            rc = h(st, rt, local, env, file)
+            if rc: break
+        else:
+            continue
+        # CONTINUE just moves on to the next i
+        if rc == BREAK: break
+        if rc == RETURN: return rc
+    return NORMAL
+
+def _exec_return(node: Return, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    e = node.expr
+    rt._return_value = None if e is None else e.eval_fn(e, rt, local, env, file)
+    rt._signal_node = node
+    return RETURN
+
+def _exec_break(node: Break, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    rt._signal_node = node
+    return BREAK
+
+def _exec_continue(node: Continue, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    rt._signal_node = node
+    return CONTINUE
+
+def _exec_exprstmt(node: ExprStmt, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    e = node.expr
+    e.eval_fn(e, rt, local, env, file)
+    return NORMAL
+
+def _exec_unknown(node: Node, rt: Runtime, local: Scope, env: Scope, file: str) -> int:
+    raise ZoteError(f"Unknown statement node {type(node)}", file, node.tok.line, node.tok.col)
+
+def _eval_literal(node: Literal, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    return node.value
+
+def _eval_var(node: Var, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    name = node.name
+    if name in local: return local[name]
+    if name in env: return env[name]
+    raise ZoteError(f"Undefined variable '{name}'", file, node.tok.line, node.tok.col)
+
+def _eval_listlit(node: ListLit, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    return [x.eval_fn(x, rt, local, env, file) for x in node.items]
+
+def _eval_maplit(node: MapLit, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    m: Dict[Any, Any] = {}
+    for k, v in node.items:
+        m[k] = v.eval_fn(v, rt, local, env, file)
+    return m
+
+def _eval_index(node: Index, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    o = node.obj; k = node.key
+    obj = o.eval_fn(o, rt, local, env, file)
+    key = k.eval_fn(k, rt, local, env, file)
+    t = type(obj)
+    if t is dict:
+        return obj.get(key, None)
+    if t is list:
+        idx = int(key)
+        if idx < 0 or idx >= len(obj):
+            return None
+        return obj[idx]
+    raise ZoteError("Indexing requires list or map", file, node.tok.line, node.tok.col)
+
+# Unary, one handler per operator
+
+def _eval_neg(node: Unary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    e = node.expr
+    v = e.eval_fn(e, rt, local, env, file)
+    if type(v) not in _NUM_TYPES:
+        raise ZoteError("Unary - requires number", file, node.tok.line, node.tok.col)
+    return -v
+
+def _eval_not(node: Unary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    e = node.expr
+    return not truthy(e.eval_fn(e, rt, local, env, file))
+
+def _eval_unary_unknown(node: Unary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    e = node.expr
+    e.eval_fn(e, rt, local, env, file)
+    raise ZoteError(f"Unknown unary {node.op}", file, node.tok.line, node.tok.col)
+
+def _eval_call(node: Call, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    f = node.fn
+    fnv = f.eval_fn(f, rt, local, env, file)
+    args = [a.eval_fn(a, rt, local, env, file) for a in node.args]
+    return rt._call(fnv, args, node.tok, file)
+
+def _eval_unknown(node: Node, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    raise ZoteError(f"Unknown expr node {type(node)}", file, node.tok.line, node.tok.col)
+
+# function-frame variants of the handlers that bind or read names
+
+def _exec_let_slot(node: Let, rt: Runtime, frame: Frame, env: Scope, file: str) -> int:
+    e = node.expr
+    frame[node.slot] = e.eval_fn(e, rt, frame, env, file)
+    return NORMAL
+
+def _exec_fn_slot(node: Fn, rt: Runtime, frame: Frame, env: Scope, file: str) -> int:
+    frame[node.slot] = ZoteFn(node.name, node.params, node.body, env, file, node.nslots, node.param_slots)
+    return NORMAL
+
+def _exec_assign_slot(node: Assign, rt: Runtime, frame: Frame, env: Scope, file: str) -> int:
+    e = node.expr
+    val = e.eval_fn(e, rt, frame, env, file)
+    t = node.target; slot = t.slot
+    if frame[slot] is not _UNSET:
+        frame[slot] = val
+    elif t.name in env:
+        env[t.name] = val
+    else:
+        frame[slot] = val
+    return NORMAL
+
+def _exec_for_slot(node: ForRange, rt: Runtime, frame: Frame, env: Scope, file: str) -> int:
+    s = node.start; e = node.end
+    a = s.eval_fn(s, rt, frame, env, file)
+    b = e.eval_fn(e, rt, frame, env, file)
+    if type(a) not in _NUM_TYPES or type(b) not in _NUM_TYPES:
+        raise ZoteError("range(a,b) requires numbers", file, node.tok.line, node.tok.col)
+    slot = node.slot
+    body = node.body.ops
+    for i in range(int(a), int(b)):
+        frame[slot] = i
+        for h, st in body:
+            rc = h(st, rt, frame, env, file)
+            if rc: break
+        else:
+            continue
+        if rc == BREAK: break
+        if rc == RETURN: return rc
+    return NORMAL
+
+def _eval_slot(node: Var, rt: Runtime, frame: Frame, env: Scope, file: str) -> Any:
+    v = frame[node.slot]
+    if v is not _UNSET: return v
+    name = node.name
+    if name in env: return env[name]
+    raise ZoteError(f"Undefined variable '{name}'", file, node.tok.line, node.tok.col)
+
+def _eval_global(node: Var, rt: Runtime, frame: Frame, env: Scope, file: str) -> Any:
+    name = node.name
+    if name in env: return env[name]
+    raise ZoteError(f"Undefined variable '{name}'", file, node.tok.line, node.tok.col)
+
+# Binary, one handler per operator
+
+def _eval_and(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    x = node.a
+    a = x.eval_fn(x, rt, local, env, file)
+    if not truthy(a): return a
+    y = node.b
+    return y.eval_fn(y, rt, local, env, file)
+
+def _eval_or(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    x = node.a
+    a = x.eval_fn(x, rt, local, env, file)
+    if truthy(a): return a
+    y = node.b
+    return y.eval_fn(y, rt, local, env, file)
+
+def _eval_add(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    x = node.a; y = node.b
+    a = x.eval_fn(x, rt, local, env, file)
+    b = y.eval_fn(y, rt, local, env, file)
+    # string concat for +
+    if type(a) is str or type(b) is str:
+        return str(a) + str(b)
+    return num_binop("+", a, b, node.tok, file)
+
+def _arith_handler(op: str) -> Callable[..., Any]:
+    def h(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+        x = node.a; y = node.b
+        a = x.eval_fn(x, rt, local, env, file)
+        b = y.eval_fn(y, rt, local, env, file)
+        return num_binop(op, a, b, node.tok, file)
+    return h
+
+def _eval_eq(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    x = node.a; y = node.b
+    return x.eval_fn(x, rt, local, env, file) == y.eval_fn(y, rt, local, env, file)
+
+def _eval_ne(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    x = node.a; y = node.b
+    return x.eval_fn(x, rt, local, env, file) != y.eval_fn(y, rt, local, env, file)
+
+def _compare_handler(op: str, cmp: Callable[[Any, Any], Any]) -> Callable[..., Any]:
+    def h(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+        x = node.a; y = node.b
+        a = x.eval_fn(x, rt, local, env, file)
+        b = y.eval_fn(y, rt, local, env, file)
+        if type(a) not in _CMP_TYPES or type(b) not in _CMP_TYPES:
+            raise ZoteError(f"Compare {op} requires comparable types", file, node.tok.line, node.tok.col)
+        return cmp(a, b)
+    return h
+
+# Number-only fast paths. Nodes start on these; the first operand that is
+# not a plain int or float rewrites node.eval_fn to the generic handler
+# above, which the node then keeps.
+
+def _num_handler(op: str, fn: Callable[[Any, Any], Any], generic: Callable[..., Any]) -> Callable[..., Any]:
+    def h(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+        x = node.a; y = node.b
+        a = x.eval_fn(x, rt, local, env, file)
+        b = y.eval_fn(y, rt, local, env, file)
+        ta = type(a); tb = type(b)
+        if (ta is int or ta is float) and (tb is int or tb is float):
+            return fn(a, b)
+        node.eval_fn = generic
+        if op == "+" and (ta is str or tb is str):
+            return str(a) + str(b)
+        return num_binop(op, a, b, node.tok, file)
+    return h
+
+def _num_compare_handler(op: str, cmp: Callable[[Any, Any], Any], generic: Callable[..., Any]) -> Callable[..., Any]:
+    def h(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+        x = node.a; y = node.b
+        a = x.eval_fn(x, rt, local, env, file)
+        b = y.eval_fn(y, rt, local, env, file)
+        ta = type(a); tb = type(b)
+        if (ta is int or ta is float) and (tb is int or tb is float):
+            return cmp(a, b)
+        node.eval_fn = generic
+        if type(a) not in _CMP_TYPES or type(b) not in _CMP_TYPES:
+            raise ZoteError(f"Compare {op} requires comparable types", file, node.tok.line, node.tok.col)
+        return cmp(a, b)
+    return h
+
+def _eval_binary_unknown(node: Binary, rt: Runtime, local: Scope, env: Scope, file: str) -> Any:
+    # operands still run first, as they did before the op was looked at
+    x = node.a; y = node.b
+    x.eval_fn(x, rt, local, env, file)
+    y.eval_fn(y, rt, local, env, file)
+    raise ZoteError(f"Unknown binary {node.op}", file, node.tok.line, node.tok.col)
+
+_EXEC_TABLE: Dict[type, Callable[..., None]] = {
+    Import: _exec_import, Let: _exec_let, Assign: _exec_assign, If: _exec_if,
+    While: _exec_while, ForRange: _exec_for, Fn: _exec_fn, Return: _exec_return,
+    Break: _exec_break, Continue: _exec_continue, ExprStmt: _exec_exprstmt,
+    Block: _run_block, Program: _run_block,
+}
+_EVAL_TABLE: Dict[type, Callable[..., Any]] = {
+    Literal: _eval_literal, Var: _eval_var, Call: _eval_call,
+    Index: _eval_index, ListLit: _eval_listlit, MapLit: _eval_maplit,
+}
+_UNARY_TABLE: Dict[str, Callable[..., Any]] = {"-": _eval_neg, "!": _eval_not}
+_BINARY_TABLE: Dict[str, Callable[..., Any]] = {
+    "and": _eval_and, "or": _eval_or,
+    "+": _num_handler("+", operator.add, _eval_add),
+    "-": _num_handler("-", operator.sub, _arith_handler("-")),
+    "*": _num_handler("*", operator.mul, _arith_handler("*")),
+    "/": _arith_handler("/"), "%": _arith_handler("%"),
+    "==": _eval_eq, "!=": _eval_ne,
+    "<": _num_compare_handler("<", operator.lt, _compare_handler("<", operator.lt)),
+    ">": _num_compare_handler(">", operator.gt, _compare_handler(">", operator.gt)),
+    "<=": _num_compare_handler("<=", operator.le, _compare_handler("<=", operator.le)),
+    ">=": _num_compare_handler(">=", operator.ge, _compare_handler(">=", operator.ge)),
+}
+
+_FRAME_EXEC_TABLE: Dict[type, Callable[..., None]] = {
+    Let: _exec_let_slot, Fn: _exec_fn_slot, ForRange: _exec_for_slot,
+}
+
+# Constant folding, run before resolve(). Binary/Unary nodes whose operands
+# are literals are evaluated once, by their own handlers, and replaced with
+# the result; anything that raises is left alone to fail at run time. An if
+# with a literal condition is replaced by the branch it takes (or dropped).
+# List and map literals are never folded: each evaluation must build a
+# fresh container.
+
+def _fold_const(node: Node, handler: Callable[..., Any]) -> Node:
+    for c in iter_children(node):
+        c.eval_fn = _eval_literal
+    try:
+        v = handler(node, None, None, None, "")
+    except Exception:
+        # e.g. "a" < 1 raises TypeError; it must only fail if it runs
+        return node
+    return Literal(node.tok, v)
+
+def _fold(node: Node) -> Optional[Node]:
+    t = type(node)
+    if t is MapLit:
+        node.items = [(k, _fold(v)) for k, v in node.items]
+        return node
+    for f in CHILD_FIELDS.get(t, ()):
+        v = getattr(node, f)
+        if type(v) is list:
+            # only statement lists can lose entries
+            setattr(node, f, [c for c in map(_fold, v) if c is not None])
+        elif v is not None:
+            setattr(node, f, _fold(v))
+    if t is Binary:
+        if type(node.a) is Literal and type(node.b) is Literal:
+            return _fold_const(node, _BINARY_TABLE.get(node.op, _eval_binary_unknown))
+    elif t is Unary:
+        if type(node.expr) is Literal:
+            return _fold_const(node, _UNARY_TABLE.get(node.op, _eval_unary_unknown))
+    elif t is If:
+        if type(node.cond) is Literal:
+            return node.then_b if truthy(node.cond.value) else node.else_b
+    return node
+
+def fold(root: Node) -> None:
+    _fold(root)
+
+def _fn_slots(fn: Fn) -> Dict[str, int]:
+    slots: Dict[str, int] = {}
+    for p in fn.params:
+        slots.setdefault(p, len(slots))
+    stack = list(fn.body.body)
+    while stack:
+        node = stack.pop()
+        t = type(node)
+        if t is Let or t is ForRange or t is Fn:
+            slots.setdefault(node.name, len(slots))
+        elif t is Assign and type(node.target) is Var:
+            slots.setdefault(node.target.name, len(slots))
+        if t is not Fn:  # a nested fn's body has its own frame
+            stack.extend(iter_children(node))
+    return slots
+
+def resolve(root: Node) -> None:
+    stack: List[Tuple[Node, Optional[Dict[str, int]]]] = [(root, None)]
+    while stack:
+        node, slots = stack.pop()
+        t = type(node)
+        if slots is not None and (t is Var or t is Let or t is ForRange or t is Fn):
+            node.slot = slots.get(node.name, -1)
+        elif t is Call:
+            node.args = tuple(node.args)
+        if t is Fn:
+            inner = _fn_slots(node)
+            node.nslots = len(inner)
+            ps = tuple(inner[p] for p in node.params)
+            node.param_slots = None if ps == tuple(range(len(ps))) else ps
+            stack.append((node.body, inner))
+        else:
+            stack.extend((c, slots) for c in iter_children(node))
+
+def annotate(root: Node) -> None:
+    # run after resolve(): handlers inside functions depend on the slots
+    stack: List[Tuple[Node, bool]] = [(root, False)]
+    blocks: List[Block] = []
+    while stack:
+        node, in_fn = stack.pop()
+        t = type(node)
+        if in_fn and t in _FRAME_EXEC_TABLE:
+            node.exec_fn = _FRAME_EXEC_TABLE[t]
+        elif in_fn and t is Assign and type(node.target) is Var:
+            node.exec_fn = _exec_assign_slot
+        else:
+            node.exec_fn = _EXEC_TABLE.get(t, _exec_unknown)
+        if t is Binary:
+            node.eval_fn = _BINARY_TABLE.get(node.op, _eval_binary_unknown)
+        elif t is Unary:
+            node.eval_fn = _UNARY_TABLE.get(node.op, _eval_unary_unknown)
+        elif in_fn and t is Var:
+            node.eval_fn = _eval_slot if node.slot >= 0 else _eval_global
+        else:
+            node.eval_fn = _EVAL_TABLE.get(t, _eval_unknown)
+        if t is Block or t is Program:
+            blocks.append(node)
+        inner = in_fn or t is Fn
+        stack.extend((c, inner) for c in iter_children(node))
+    # statements' exec_fn never changes after this, so blocks can keep
+    # (handler, node) pairs and skip the attribute read per statement
+    for b in blocks:
+        b.ops = tuple((st.exec_fn, st) for st in b.body)
+
 # -------------------------
 # Game Runner (CLI)
 # -------------------------
@@ -1133,264 +1051,337 @@ def ensure_rules_exist(root: str) -> None:
         "rules/main.zs","rules/math_system.zs","rules/factions.zs","rules/economy.zs",
         "rules/diplomacy.zs","rules/war.zs","rules/tech.zs","rules/events.zs","rules/space.zs"
     ]
-    missing = [p for p in req if not os.path.exists(os.path.join(root, p))]
+    # one directory listing instead of a stat per file
+    try:
+        with os.scandir(os.path.join(root, "rules")) as it:
+            present = {"rules/" + e.name for e in it}
+    except OSError:
+        present = set()
+    missing = [p for p in req if p not in present]
     if missing:
         print("Missing rule files:")
         for m in missing: print(" -", m)
         print("Create them from the project spec output, then rerun.")
         sys.exit(1)
 
-def state_hash(obj: Any) -> str:
-    s = json.dumps(obj, sort_keys=True, separators=(",",":"))
-    # cheap deterministic hash
-    h = 2166136261
-    for ch in s.encode("utf-8"):
-        h ^= ch
-        h = (h * 16777619) & 0xFFFFFFFF
-    return hex(h)
-
-def main():
-    root = os.path.dirname(os.path.abspath(__file__))
-    ensure_rules_exist(root)
-
-    debug = "--debug" in sys.argv
-    fast  = "--fast" in sys.argv
-
-    rt = Runtime(root_dir=root, debug=debug)
-    env = rt.load_module("rules/main.zs")
-
-    def zs_call(name: str, *args):
-        fnv = env.get(name)
-        if fnv is None:
-            raise ZoteError(f"Missing required function {name}", "rules/main.zs", 1, 1)
-        return rt._call(fnv, list(args), Tok("ID", name, 1,1), "rules/main.zs")
-
-    # CLI commands
-    print("ZoteBoat: Empires Beyond (CLI)")
-    print("Commands: new [seed], load <file>, save <file>, replay <file>, quit")
-
-    state = None
-    actions_log: List[Dict[str, Any]] = []
-    seed = 0
-    last_actions = []
-    last_actions_label = "none"
-
+def _all_finite(obj: Any) -> bool:
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        t = type(o)
+        if t is float:
+            if not math.isfinite(o): return False
+        elif t is dict:
+            stack.extend(o.values())
+        elif t is list:
+            stack.extend(o)
+    return True
 
-    while True:
-        cmd = input("> ").strip().split()
-        if not cmd:
-            continue
-        if cmd[0] == "quit":
+def save_json(path: str, obj: Any) -> None:
+    # Pretty-printed with sorted keys either way. orjson would write NaN and
+    # Infinity as null, so such saves go through the stdlib encoder.
+    if orjson is not None and _all_finite(obj):
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
             return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+
+def load_json(path: str) -> Any:
+    if orjson is not None:
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals from the stdlib encoder
+            return json.loads(data)
+    return json.loads(read_text(path))
 
-        if cmd[0] == "new":
-            seed = int(cmd[1]) if len(cmd) > 1 else 12345
-            rt.event_sink.clear()
-            zs_call("rng_seed", seed)  # stdlib RNG
-            state = zs_call("init_game", seed)
-            actions_log = []
-            print("New game created. Seed:", seed)
-            last_actions = []
-            last_actions_label = "none"
-            continue
-
-        if cmd[0] == "save" and state is not None:
-            path = cmd[1] if len(cmd)>1 else "save.json"
-            blob = {"seed": seed, "state": zs_call("serialize", state), "actions": actions_log}
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(blob, f, indent=2, sort_keys=True)
-            print("Saved:", path)
-            continue
-
-        if cmd[0] == "load":
-            path = cmd[1] if len(cmd)>1 else "save.json"
-            blob = json.loads(read_text(path))
-            seed = int(blob["seed"])
-            zs_call("rng_seed", seed)
-            state = zs_call("deserialize", blob["state"])
-            actions_log = blob.get("actions", [])
-            print("Loaded:", path, "Seed:", seed, "Turns:", len(actions_log))
-            last_actions = []
-            last_actions_label = "none"
-            continue
-
-        if cmd[0] == "replay":
-            path = cmd[1] if len(cmd)>1 else "save.json"
-            blob = json.loads(read_text(path))
-            seed = int(blob["seed"])
-            zs_call("rng_seed", seed)
-            state = zs_call("init_game", seed)
-            for a in blob.get("actions", []):
-                state = zs_call("apply_action", state, a)
-                out = zs_call("tick", state)
-                state = out["state"]
-            print("Replay done. Final hash:", state_hash(zs_call("serialize", state)))
-            continue
-
-        if state is None:
-            print("Start a game with: new [seed]")
-            continue
-
-        # in-game commands
-        if cmd[0] == "show":
-            out = zs_call("ui_summary", state, debug)
-            print(out)
-            continue
-
-        # Keep these variables near the top of main(), before the while loop:
-        # last_actions = []
-        # last_actions_label = "all"
-
-        if cmd[0] == "actions":
-            # Always regenerate actions fresh from state
-            all_acts = zs_call("available_actions", state)
-
-            # Parse filter target:
-            # - "actions"                => grouped by faction
-            # - "actions all"            => flat list all
-            # - "actions <Faction Name>" => only actions involving that faction
-            arg = " ".join(cmd[1:]).strip() if len(cmd) > 1 else ""
-
-            if arg.lower() == "all":
-                last_actions = all_acts
-                last_actions_label = "all"
-                for i, a in enumerate(last_actions):
-                    print(f"[{i}] {describe_action(a)}")
-                continue
+def state_hash(obj: Any) -> str:
+    # cheap deterministic hash. Always the stdlib encoding, never orjson:
+    # their float/NaN spellings differ, and hashes must match across machines
+    s = json.dumps(obj, sort_keys=True, separators=(",",":"))
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=8).hexdigest()
 
-            if arg:
-                fname = normalize_faction_name(state, arg)
-                if not fname:
-                    print(f"Unknown faction '{arg}'. Try: factions")
-                    continue
-
-                filtered = []
-                for a in all_acts:  # <-- FIX: filter from fresh action list
-                    inv = action_involved_factions(a)
-                    if fname in inv:
-                        filtered.append(a)
-
-                last_actions = filtered
-                last_actions_label = fname
-                print(f"Actions involving {fname}:")
-                for i, a in enumerate(last_actions):
-                    print(f"[{i}] {describe_action(a)}")
-                continue
+# REPL session state, passed to every command handler
+@dataclass
+class ReplContext:
+    rt: Runtime
+    env: Dict[str, Any]
+    debug: bool
+    state: Any = None
+    seed: int = 0
+    actions_log: List[Dict[str, Any]] = field(default_factory=list)
+    last_actions: List[Any] = field(default_factory=list)
+    last_actions_label: str = "none"
+    state_version: int = 0  # bumped on every state change
+    # (state_version, actions, grouped, by faction) from the last listing
+    action_cache: Optional[Tuple[int, List[Any], Dict[str, List[Any]], Dict[str, List[Any]]]] = None
+    faction_cache: Optional[Tuple[int, FactionIndex]] = None  # (state_version, index)
+    # name -> (function, call-site token), looked up in env on first use
+    bound: Dict[str, Tuple[Any, Tok]] = field(default_factory=dict, init=False, repr=False)
+
+    def bind(self, name: str) -> Tuple[Any, Tok]:
+        b = self.bound.get(name)
+        if b is None:
+            fnv = self.env.get(name)
+            if fnv is None:
+                raise ZoteError(f"Missing required function {name}", "rules/main.zs", 1, 1)
+            b = self.bound[name] = (fnv, Tok("ID", name, 1,1))
+        return b
+
+    def call(self, name: str, *args):
+        fnv, tok = self.bind(name)
+        return self.rt._call(fnv, list(args), tok, "rules/main.zs")
+
+    def set_state(self, state: Any) -> None:
+        self.state = state
+        self.state_version += 1
+
+    def faction_index(self) -> FactionIndex:
+        c = self.faction_cache
+        if c is None or c[0] != self.state_version:
+            c = self.faction_cache = (self.state_version, FactionIndex(self.state))
+        return c[1]
+
+    def grouped_actions(self) -> Tuple[List[Any], Dict[str, List[Any]], Dict[str, List[Any]]]:
+        # Actions only depend on the state, so one rules call per state
+        # version serves every listing until set_state bumps it.
+        c = self.action_cache
+        if c is None or c[0] != self.state_version:
+            acts = self.call("available_actions", self.state)
+            by_faction: Dict[str, List[Any]] = {}
+            for a in acts:
+                for f in dict.fromkeys(action_involved_factions(a)):
+                    by_faction.setdefault(f, []).append(a)
+            c = self.action_cache = (self.state_version, acts, group_actions_by_faction(self.state, acts), by_faction)
+        return c[1], c[2], c[3]
+
+    def forget_actions(self) -> None:
+        self.last_actions = []
+        self.last_actions_label = "none"
+
+# Command handlers take (ctx, cmd) and return True to leave the REPL.
+
+def _cmd_quit(ctx: ReplContext, cmd: List[str]) -> bool:
+    return True
 
-            # Default: grouped by faction
-            groups = group_actions_by_faction(state, all_acts)
+def _cmd_new(ctx: ReplContext, cmd: List[str]) -> None:
+    ctx.seed = int(cmd[1]) if len(cmd) > 1 else 12345
+    ctx.rt.event_sink.clear()
+    ctx.call("rng_seed", ctx.seed)  # stdlib RNG
+    ctx.set_state(ctx.call("init_game", ctx.seed))
+    ctx.actions_log = []
+    print("New game created. Seed:", ctx.seed)
+    ctx.forget_actions()
+
+def _cmd_save(ctx: ReplContext, cmd: List[str]) -> None:
+    path = cmd[1] if len(cmd)>1 else "save.json"
+    blob = {"seed": ctx.seed, "state": ctx.call("serialize", ctx.state), "actions": ctx.actions_log}
+    save_json(path, blob)
+    print("Saved:", path)
+
+def _cmd_load(ctx: ReplContext, cmd: List[str]) -> None:
+    path = cmd[1] if len(cmd)>1 else "save.json"
+    blob = load_json(path)
+    ctx.seed = int(blob["seed"])
+    ctx.call("rng_seed", ctx.seed)
+    ctx.set_state(ctx.call("deserialize", blob["state"]))
+    ctx.actions_log = blob.get("actions", [])
+    print("Loaded:", path, "Seed:", ctx.seed, "Turns:", len(ctx.actions_log))
+    ctx.forget_actions()
+
+def _cmd_replay(ctx: ReplContext, cmd: List[str]) -> None:
+    path = cmd[1] if len(cmd)>1 else "save.json"
+    blob = load_json(path)
+    ctx.seed = int(blob["seed"])
+    ctx.call("rng_seed", ctx.seed)
+    state = ctx.call("init_game", ctx.seed)
+    call = ctx.rt._call
+    apply_fn, apply_tok = ctx.bind("apply_action")
+    tick_fn, tick_tok = ctx.bind("tick")
+    for a in blob.get("actions", []):
+        state = call(apply_fn, [state, a], apply_tok, "rules/main.zs")
+        state = call(tick_fn, [state], tick_tok, "rules/main.zs")["state"]
+    ctx.set_state(state)
+    print("Replay done. Final hash:", state_hash(ctx.call("serialize", state)))
+
+def _cmd_show(ctx: ReplContext, cmd: List[str]) -> None:
+    print(ctx.call("ui_summary", ctx.state, ctx.debug))
+
+def _cmd_actions(ctx: ReplContext, cmd: List[str]) -> None:
+    state = ctx.state
+    all_acts, groups, by_faction = ctx.grouped_actions()
+
+    # Parse filter target:
+    # - "actions"                => grouped by faction
+    # - "actions all"            => flat list all
+    # - "actions <Faction Name>" => only actions involving that faction
+    arg = " ".join(cmd[1:]).strip() if len(cmd) > 1 else ""
+
+    if arg.lower() == "all":
+        ctx.last_actions = all_acts
+        ctx.last_actions_label = "all"
+        for i, a in enumerate(all_acts):
+            print(f"[{i}] {describe_action(a)}")
+        return
+
+    if arg:
+        fname = normalize_faction_name(state, arg, ctx.faction_index())
+        if not fname:
+            print(f"Unknown faction '{arg}'. Try: factions")
+            return
 
-            # We'll also build a single flattened list that matches printed indices.
-            flat = []
-            keys_sorted = sorted(groups.keys(), key=lambda x: (x == "(global)", x))
+        filtered = list(by_faction.get(fname, ()))
+        ctx.last_actions = filtered
+        ctx.last_actions_label = fname
+        print(f"Actions involving {fname}:")
+        for i, a in enumerate(filtered):
+            print(f"[{i}] {describe_action(a)}")
+        return
+
+    # Default: grouped by faction
+    # We'll also build a single flattened list that matches printed indices.
+    flat = []
+    keys_sorted = sorted(groups.keys(), key=lambda x: (x == "(global)", x))
+
+    print("Actions (grouped). Tip: `actions <Faction Name>` to filter, or `actions all` for flat list.")
+    for g in keys_sorted:
+        print(f"\n== {g} ==")
+        for a in groups[g]:
+            flat.append(a)
+            print(f"[{len(flat) - 1}] {describe_action(a)}")
+
+    ctx.last_actions = flat
+    ctx.last_actions_label = "grouped"
+
+def _cmd_do(ctx: ReplContext, cmd: List[str]) -> None:
+    if len(cmd) < 2:
+        print("Usage: do <action_index>")
+        return
+
+    if not ctx.last_actions:
+        ctx.last_actions = ctx.call("available_actions", ctx.state)
+        ctx.last_actions_label = "auto"
 
-            print("Actions (grouped). Tip: `actions <Faction Name>` to filter, or `actions all` for flat list.")
-            for g in keys_sorted:
-                print(f"\n== {g} ==")
-                for a in groups[g]:
-                    flat.append(a)
-                    print(f"[{len(flat) - 1}] {describe_action(a)}")
+    try:
+        idx = int(cmd[1])
+    except ValueError:
+        print("Bad index (must be an integer).")
+        return
 
-            last_actions = flat
-            last_actions_label = "grouped"
-            continue
+    if idx < 0 or idx >= len(ctx.last_actions):
+        print(f"Bad index. You have {len(ctx.last_actions)} actions listed (view: {ctx.last_actions_label}).")
+        return
 
-        if cmd[0] == "do":
-            if len(cmd) < 2:
-                print("Usage: do <action_index>")
-                continue
+    action = ctx.last_actions[idx]
+    ctx.set_state(ctx.call("apply_action", ctx.state, action))
+    ctx.actions_log.append(action)
 
-            if not last_actions:
-                last_actions = zs_call("available_actions", state)
-                last_actions_label = "auto"
+    out = ctx.call("tick", ctx.state)
+    ctx.set_state(out["state"])
+    log = out["log"]
 
-            try:
-                idx = int(cmd[1])
-            except ValueError:
-                print("Bad index (must be an integer).")
-                continue
+    sink = ctx.rt.event_sink
+    if sink:
+        log = log + [f"EVENT[{e['tag']}]: {e['payload']}" for e in sink]
+        sink.clear()
 
-            if idx < 0 or idx >= len(last_actions):
-                print(f"Bad index. You have {len(last_actions)} actions listed (view: {last_actions_label}).")
-                continue
+    print("\n".join([str(x) for x in log]))
 
-            action = last_actions[idx]
-            state = zs_call("apply_action", state, action)
-            actions_log.append(action)
+def _cmd_help(ctx: ReplContext, cmd: List[str]) -> None:
+    print(cmd_help())
 
-            out = zs_call("tick", state)
-            state = out["state"]
-            log = out["log"]
+def _cmd_factions(ctx: ReplContext, cmd: List[str]) -> None:
+    print(show_factions(ctx.state, ctx.faction_index()))
 
-            if rt.event_sink:
-                log = log + [f"EVENT[{e['tag']}]: {e['payload']}" for e in rt.event_sink]
-                rt.event_sink.clear()
+def _cmd_faction(ctx: ReplContext, cmd: List[str]) -> None:
+    if len(cmd) < 2:
+        print("Usage: faction <name>")
+        return
+    name = " ".join(cmd[1:])
+    print(show_one_faction(ctx.state, name, debug=ctx.debug, index=ctx.faction_index()))
 
-            print("\n".join([str(x) for x in log]))
-            continue
+def _cmd_research(ctx: ReplContext, cmd: List[str]) -> None:
+    print(show_research(ctx.state, ctx.faction_index()))
 
-        if cmd[0] == "help":
-            print(cmd_help())
-            continue
+def _cmd_policies(ctx: ReplContext, cmd: List[str]) -> None:
+    print(show_policies(ctx.state, ctx.faction_index()))
 
-        if cmd[0] == "factions":
-            print(show_factions(state))
-            continue
+def _cmd_wars(ctx: ReplContext, cmd: List[str]) -> None:
+    print(show_wars(ctx.state))
 
-        if cmd[0] == "faction":
-            if len(cmd) < 2:
-                print("Usage: faction <name>")
-                continue
-            name = " ".join(cmd[1:])
-            print(show_one_faction(state, name, debug=debug))
-            continue
+def _cmd_treaties(ctx: ReplContext, cmd: List[str]) -> None:
+    print(show_treaties(ctx.state))
 
+def _cmd_market(ctx: ReplContext, cmd: List[str]) -> None:
+    print(show_market(ctx.state))
 
-        if cmd[0] == "research":
-            print(show_research(state))
-            continue
+def _cmd_space(ctx: ReplContext, cmd: List[str]) -> None:
+    print(ctx.call("ui_space", ctx.state, ctx.debug))
 
-        if cmd[0] == "policies":
-            print(show_policies(state))
-            continue
+def _cmd_top(ctx: ReplContext, cmd: List[str]) -> None:
+    print(top_dashboard(ctx.state, debug=ctx.debug, index=ctx.faction_index()))
 
-        if cmd[0] == "wars":
-            print(show_wars(state))
-            continue
+def _cmd_tick(ctx: ReplContext, cmd: List[str]) -> None:
+    # no-op tick (useful for tests)
+    out = ctx.call("tick", ctx.state)
+    ctx.set_state(out["state"])
+    ctx.forget_actions()
+    print("\n".join([str(x) for x in out["log"]]))
 
-        if cmd[0] == "treaties":
-            print(show_treaties(state))
-            continue
+def _cmd_hash(ctx: ReplContext, cmd: List[str]) -> None:
+    print(state_hash(ctx.call("serialize", ctx.state)))
 
-        if cmd[0] == "market":
-            print(show_market(state))
-            continue
+# available with or without a game in progress
+_SESSION_COMMANDS: Dict[str, Callable[[ReplContext, List[str]], Optional[bool]]] = {
+    "quit": _cmd_quit, "new": _cmd_new, "load": _cmd_load, "replay": _cmd_replay,
+}
+# need a game in progress
+_GAME_COMMANDS: Dict[str, Callable[[ReplContext, List[str]], Optional[bool]]] = {
+    "save": _cmd_save, "show": _cmd_show, "actions": _cmd_actions, "do": _cmd_do,
+    "help": _cmd_help, "factions": _cmd_factions, "faction": _cmd_faction,
+    "research": _cmd_research, "policies": _cmd_policies, "wars": _cmd_wars,
+    "treaties": _cmd_treaties, "market": _cmd_market, "space": _cmd_space,
+    "top": _cmd_top, "tick": _cmd_tick, "hash": _cmd_hash,
+}
 
+def main():
+    root = os.path.dirname(os.path.abspath(__file__))
+    ensure_rules_exist(root)
 
-        if cmd[0] == "space":
-            out = zs_call("ui_space", state, debug)
-            print(out)
-            continue
+    debug = "--debug" in sys.argv
+    fast  = "--fast" in sys.argv
 
-        if cmd[0] == "top":
-            print(top_dashboard(state, debug=debug))
-            continue
+    rt = Runtime(root_dir=root, debug=debug)
+    env = rt.load_module("rules/main.zs")
+    ctx = ReplContext(rt, env, debug)
 
-        if cmd[0] == "tick":
-            # no-op tick (useful for tests)
-            out = zs_call("tick", state)
-            state = out["state"]
-            log = out["log"]
-            last_actions = []
-            last_actions_label = "none"
-            print("\n".join([str(x) for x in log]))
-            continue
+    # CLI commands
+    print("ZoteBoat: Empires Beyond (CLI)")
+    print("Commands: new [seed], load <file>, save <file>, replay <file>, quit")
 
-        if cmd[0] == "hash":
-            print(state_hash(zs_call("serialize", state)))
+    while True:
+        cmd = input("> ").strip().split()
+        if not cmd:
             continue
-
-        print("Commands: show, actions, do <i>, tick, save <f>, load <f>, replay <f>, hash, quit")
+        handler = _SESSION_COMMANDS.get(cmd[0])
+        if handler is None:
+            if ctx.state is None:
+                print("Start a game with: new [seed]")
+                continue
+            handler = _GAME_COMMANDS.get(cmd[0])
+            if handler is None:
+                print("Commands: show, actions, do <i>, tick, save <f>, load <f>, replay <f>, hash, quit")
+                continue
+        if handler(ctx, cmd):
+            return
 
 if __name__ == "__main__":
     try:
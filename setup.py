@@ -0,0 +1,15 @@
+# Optional: compile the ZoteScript front-end with Cython.
+#
+#   pip install cython
+#   python setup.py build_ext --inplace
+#
+# The game itself needs nothing beyond the stdlib; without the extension
+# _frontend.py is imported as plain Python.
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="zoteboat-frontend",
+    ext_modules=cythonize(["_frontend.py"], language_level=3),
+)
@@ -1,4 +1,5 @@
-import os, unittest, json
+import os, tempfile, unittest, json
+import main
 from main import Runtime, ZoteError, state_hash
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -10,6 +11,15 @@ class TestZoteScript(unittest.TestCase):
     def load(self, path):
         return self.rt.load_module(path)
 
+    def load_src(self, src):
+        # run a throwaway module from its own root dir
+        d = tempfile.TemporaryDirectory()
+        self.addCleanup(d.cleanup)
+        with open(os.path.join(d.name, "m.zs"), "w", encoding="utf-8") as f:
+            f.write(src)
+        rt = Runtime(root_dir=d.name, debug=False)
+        return rt, rt.load_module("m.zs")
+
     def call(self, env, name, *args):
         fnv = env[name]
         return self.rt._call(fnv, list(args), None if False else type("T",(),{"line":1,"col":1})(), path := "test")
@@ -46,5 +56,110 @@ class TestZoteScript(unittest.TestCase):
         h2 = state_hash(self.rt._call(env["serialize"], [st2], None, "t"))
         self.assertEqual(h1,h2)
 
+    def test_fold_keeps_failing_constants(self):
+        rt, env = self.load_src('fn f() { return "a" < 1; } fn g() { return 1 / 0; } let x = 1;')
+        self.assertEqual(env["x"], 1)
+        with self.assertRaises(Exception):
+            rt._call(env["f"], [], None, "t")
+        with self.assertRaises(ZoteError):
+            rt._call(env["g"], [], None, "t")
+
+    def test_loop_signals_inside_functions(self):
+        rt, env = self.load_src("""
+fn f() {
+    let out = [];
+    for i in range(0, 10) {
+        if i == 1 { continue; }
+        let j = 0;
+        while true {
+            j = j + 1;
+            if j == 2 { break; }
+        }
+        push(out, i * 10 + j);
+        if i == 3 { return out; }
+    }
+    return null;
+}
+fn g() { while true { return 7; } }
+""")
+        self.assertEqual(rt._call(env["f"], [], None, "t"), [2, 22, 32])
+        self.assertEqual(rt._call(env["g"], [], None, "t"), 7)
+
+    def test_signal_outside_loop_reports_position(self):
+        rt, env = self.load_src("fn f() {\n  break;\n}\nfn h() { continue; }")
+        with self.assertRaises(ZoteError) as cm:
+            rt._call(env["f"], [], None, "t")
+        self.assertIn("m.zs:2:3", str(cm.exception))
+        self.assertIn("'break' outside loop", str(cm.exception))
+        with self.assertRaises(ZoteError) as cm:
+            rt._call(env["h"], [], None, "t")
+        self.assertIn("'continue' outside loop", str(cm.exception))
+        with self.assertRaises(ZoteError) as cm:
+            self.load_src("let a = 1;\n\n  return a;")
+        self.assertIn("m.zs:3:3", str(cm.exception))
+        self.assertIn("'return' outside function", str(cm.exception))
+
+    def test_state_hash_ignores_orjson(self):
+        st = {"b": [1e-7, 1e16, float("nan"), 2**70], "a": "\u00e9"}
+        h = state_hash(st)
+        saved, main.orjson = main.orjson, None
+        try:
+            self.assertEqual(state_hash(st), h)
+        finally:
+            main.orjson = saved
+
+    def test_save_load_round_trip(self):
+        d = tempfile.TemporaryDirectory()
+        self.addCleanup(d.cleanup)
+        blob = {"seed": 3, "state": {"x": 1.5, "n": None, "bad": float("nan"), "big": float("inf")}}
+        saved = main.orjson
+        try:
+            for write_with in (saved, None):
+                for read_with in (saved, None):
+                    path = os.path.join(d.name, "s.json")
+                    main.orjson = write_with
+                    main.save_json(path, blob)
+                    main.orjson = read_with
+                    back = main.load_json(path)
+                    self.assertEqual(back["state"]["x"], 1.5)
+                    self.assertIsNone(back["state"]["n"])
+                    self.assertNotEqual(back["state"]["bad"], back["state"]["bad"])
+                    self.assertEqual(back["state"]["big"], float("inf"))
+        finally:
+            main.orjson = saved
+
+    def test_function_scope_slots(self):
+        rt, env = self.load_src("""
+fn late() { return g; }
+let g = 1;
+fn set_g(v) { g = v; }
+fn shadow() {
+    let out = [g];
+    let g = 5;
+    push(out, g);
+    g = 6;
+    push(out, g);
+    return out;
+}
+fn dup(a, a) { return a; }
+fn fresh() { h = 3; return h; }
+""")
+        call = lambda name, *a: rt._call(env[name], list(a), None, "t")
+        # a name the function never bound reads the module env at call time
+        self.assertEqual(call("late"), 1)
+        env["g"] = 2
+        self.assertEqual(call("late"), 2)
+        # assigning to an existing global writes env
+        call("set_g", 9)
+        self.assertEqual(env["g"], 9)
+        # reads see the global until the local is bound; later writes stay local
+        self.assertEqual(call("shadow"), [9, 5, 6])
+        self.assertEqual(env["g"], 9)
+        # repeated param names: the last argument wins
+        self.assertEqual(call("dup", 1, 2), 2)
+        # assigning an unknown name creates a local, not a global
+        self.assertEqual(call("fresh"), 3)
+        self.assertNotIn("h", env)
+
 if __name__ == "__main__":
     unittest.main()